@@ -1038,30 +1038,32 @@ class DataExporter:
         )
         
         # Step 4: Calculate Item Price with special handling for transaction-specific pricing
-        def calculate_invoice_item_price(row):
-            qty = pd.to_numeric(row.get('quantity_purchased', 0), errors='coerce')
-            transaction_amt = pd.to_numeric(row.get('transaction_amount', 0), errors='coerce')
-            case_price = row.get('case_price_amount', 0)
-            transaction_type = str(row.get('transaction_type', '')).upper().strip()
-            
-            # Convert NaN to 0 for calculations
-            qty = qty if pd.notna(qty) else 0
-            transaction_amt = transaction_amt if pd.notna(transaction_amt) else 0
-            case_price = case_price if pd.notna(case_price) else 0
+        # Iterate over plain column arrays rather than building a Series per row
+        zeros = pd.Series(0, index=merged_df.index)
+        quantities = pd.to_numeric(merged_df.get('quantity_purchased', zeros), errors='coerce').fillna(0).to_numpy()
+        transaction_amounts = pd.to_numeric(merged_df.get('transaction_amount', zeros), errors='coerce').fillna(0).to_numpy()
+        case_prices = pd.to_numeric(merged_df['case_price_amount'], errors='coerce').fillna(0).to_numpy()
+        transaction_types = merged_df.get('transaction_type', pd.Series('', index=merged_df.index)).to_numpy(dtype=object)
+        
+        item_prices = []
+        for qty, transaction_amt, case_price, transaction_type in zip(
+            quantities, transaction_amounts, case_prices, transaction_types
+        ):
+            transaction_type = str(transaction_type).upper().strip()
             
             # For REVERSAL_REIMBURSEMENT and similar transactions where both qty and transaction_amt exist,
             # always use transaction_amount/quantity_purchased to get the actual unit price
             if (qty != 0 and transaction_amt != 0 and 
                 transaction_type in ['REVERSAL_REIMBURSEMENT', 'WAREHOUSE DAMAGE']):
-                return transaction_amt / qty
+                item_prices.append(transaction_amt / qty)
             
             # For other transactions, use case_price_amount if available, otherwise transaction_amount
-            elif pd.notna(case_price) and case_price != 0:
-                return case_price
+            elif case_price != 0:
+                item_prices.append(case_price)
             else:
-                return transaction_amt
+                item_prices.append(transaction_amt)
         
-        merged_df['Item Price'] = merged_df.apply(calculate_invoice_item_price, axis=1)
+        merged_df['Item Price'] = item_prices
         
         return merged_df
     
@@ -230,6 +230,9 @@ def main():
             payments_data
         )
         
+        # Invoices and payments are only needed for the merge; free them for the exports
+        del invoices_data, payments_data
+        
         # Initialize data exporter
         exporter = DataExporter(config)
         
@@ -270,95 +273,96 @@ def main():
         
         # Record settlement history for trending and analysis
         try:
-            tracker = EntryTracker()
-            journal_data = final_data.get('journal', pd.DataFrame())
-            logger.info(f"Journal data columns: {list(journal_data.columns[:5]) if not journal_data.empty else 'EMPTY'}")
-            logger.info(f"Has settlement_id column: {'settlement_id' in journal_data.columns}")
-            
-            if settlements_data is not None and 'settlement_id' in journal_data.columns:
-                logger.info("Starting settlement history recording...")
+            with EntryTracker() as tracker:
+                journal_data = final_data.get('journal', pd.DataFrame())
+                logger.info(f"Journal data columns: {list(journal_data.columns[:5]) if not journal_data.empty else 'EMPTY'}")
+                logger.info(f"Has settlement_id column: {'settlement_id' in journal_data.columns}")
                 
-                for settlement_id in journal_data['settlement_id'].unique():
-                    # Get journal rows for GL account totals
-                    journal_rows = journal_data[journal_data['settlement_id'] == settlement_id]
-                    
-                    # Get original settlement rows for metadata (dates, amounts)
-                    settlement_rows = settlements_data[settlements_data['settlement_id'] == settlement_id]
-                    
-                    # Get formatted journal to access GL accounts
-                    formatted_journal = exporter._format_journal_data(journal_rows)
-                    
-                    # Calculate GL account totals
-                    gl_totals = {}
-                    if not formatted_journal.empty and 'GL_Account' in formatted_journal.columns:
-                        for gl_account in formatted_journal['GL_Account'].unique():
-                            gl_rows = formatted_journal[formatted_journal['GL_Account'] == gl_account]
-                            total_debit = pd.to_numeric(gl_rows.get('Debit', 0), errors='coerce').sum()
-                            total_credit = pd.to_numeric(gl_rows.get('Credit', 0), errors='coerce').sum()
-                            net_amount = total_debit - total_credit
-                            gl_totals[gl_account] = float(net_amount) if not pd.isna(net_amount) else 0.0
-                    
-                    # Get settlement metadata with proper date formatting
-                    deposit_date = ''
-                    date_from = ''
-                    date_to = ''
-                    bank_deposit = 0.0
-                    tax_count = 0
+                if settlements_data is not None and 'settlement_id' in journal_data.columns:
+                    logger.info("Starting settlement history recording...")
                     
-                    try:
-                        if 'deposit_date' in settlement_rows.columns:
-                            dd = settlement_rows['deposit_date'].iloc[0]
-                            # Convert to datetime and strip timezone
-                            dd_dt = pd.to_datetime(dd, errors='coerce', utc=True)
-                            deposit_date = dd_dt.tz_localize(None).strftime('%Y-%m-%d') if pd.notna(dd_dt) else ''
-                            logger.debug(f"  Settlement {settlement_id} deposit_date: {deposit_date}")
-                    except Exception as e:
-                        logger.debug(f"  Could not extract deposit_date: {e}")
-                    
-                    try:
-                        if 'posted_date' in settlement_rows.columns:
-                            # Convert to datetime and filter valid dates
-                            dates = pd.to_datetime(settlement_rows['posted_date'], errors='coerce')
-                            valid_dates = dates[dates.notna()]
-                            if len(valid_dates) > 0:
-                                date_from = str(valid_dates.min()).split(' ')[0]
-                                date_to = str(valid_dates.max()).split(' ')[0]
-                                logger.debug(f"  Settlement {settlement_id} date range: {date_from} to {date_to}")
-                    except Exception as e:
-                        logger.debug(f"  Could not extract date range: {e}")
-                    
-                    try:
-                        if 'total_amount' in settlement_rows.columns:
-                            # Simple sum, don't filter
-                            amounts = pd.to_numeric(settlement_rows['total_amount'], errors='coerce').fillna(0)
-                            bank_deposit = float(amounts.sum())
-                    except:
+                    for settlement_id in journal_data['settlement_id'].unique():
+                        # Get journal rows for GL account totals
+                        journal_rows = journal_data[journal_data['settlement_id'] == settlement_id]
+                        
+                        # Get original settlement rows for metadata (dates, amounts)
+                        settlement_rows = settlements_data[settlements_data['settlement_id'] == settlement_id]
+                        
+                        # Get formatted journal to access GL accounts
+                        formatted_journal = exporter._format_journal_data(journal_rows)
+                        
+                        # Calculate GL account totals
+                        gl_totals = {}
+                        if not formatted_journal.empty and 'GL_Account' in formatted_journal.columns:
+                            for gl_account in formatted_journal['GL_Account'].unique():
+                                gl_rows = formatted_journal[formatted_journal['GL_Account'] == gl_account]
+                                total_debit = pd.to_numeric(gl_rows.get('Debit', 0), errors='coerce').sum()
+                                total_credit = pd.to_numeric(gl_rows.get('Credit', 0), errors='coerce').sum()
+                                net_amount = total_debit - total_credit
+                                gl_totals[gl_account] = float(net_amount) if not pd.isna(net_amount) else 0.0
+                        
+                        # Get settlement metadata with proper date formatting
+                        deposit_date = ''
+                        date_from = ''
+                        date_to = ''
                         bank_deposit = 0.0
-                    
-                    try:
-                        if 'tax_amount' in settlement_rows.columns:
-                            tax_amounts = pd.to_numeric(settlement_rows['tax_amount'], errors='coerce').fillna(0)
-                            tax_count = int((tax_amounts != 0).sum())
-                    except:
                         tax_count = 0
+                        
+                        try:
+                            if 'deposit_date' in settlement_rows.columns:
+                                dd = settlement_rows['deposit_date'].iloc[0]
+                                # Convert to datetime and strip timezone
+                                dd_dt = pd.to_datetime(dd, errors='coerce', utc=True)
+                                deposit_date = dd_dt.tz_localize(None).strftime('%Y-%m-%d') if pd.notna(dd_dt) else ''
+                                logger.debug(f"  Settlement {settlement_id} deposit_date: {deposit_date}")
+                        except Exception as e:
+                            logger.debug(f"  Could not extract deposit_date: {e}")
+                        
+                        try:
+                            if 'posted_date' in settlement_rows.columns:
+                                # Convert to datetime and filter valid dates
+                                dates = pd.to_datetime(settlement_rows['posted_date'], errors='coerce')
+                                valid_dates = dates[dates.notna()]
+                                if len(valid_dates) > 0:
+                                    date_from = str(valid_dates.min()).split(' ')[0]
+                                    date_to = str(valid_dates.max()).split(' ')[0]
+                                    logger.debug(f"  Settlement {settlement_id} date range: {date_from} to {date_to}")
+                        except Exception as e:
+                            logger.debug(f"  Could not extract date range: {e}")
+                        
+                        try:
+                            if 'total_amount' in settlement_rows.columns:
+                                # Simple sum, don't filter
+                                amounts = pd.to_numeric(settlement_rows['total_amount'], errors='coerce').fillna(0)
+                                bank_deposit = float(amounts.sum())
+                        except:
+                            bank_deposit = 0.0
+                        
+                        try:
+                            if 'tax_amount' in settlement_rows.columns:
+                                tax_amounts = pd.to_numeric(settlement_rows['tax_amount'], errors='coerce').fillna(0)
+                                tax_count = int((tax_amounts != 0).sum())
+                        except:
+                            tax_count = 0
+                        
+                        # Record in history
+                        logger.info(f"Recording history for settlement {settlement_id}")
+                        success = tracker.record_settlement_history({
+                            'settlement_id': str(settlement_id),
+                            'deposit_date': deposit_date,
+                            'date_from': date_from,
+                            'date_to': date_to,
+                            'bank_deposit_amount': float(bank_deposit) if not pd.isna(bank_deposit) else 0.0,
+                            'total_records': len(settlement_rows),
+                            'journal_line_count': len(formatted_journal) if not formatted_journal.empty else 0,
+                            'invoice_line_count': 0,  # Will be calculated if needed
+                            'tax_line_count': tax_count,
+                            'gl_account_totals': gl_totals
+                        })
+                        logger.info(f"History recording result for {settlement_id}: {success}")
                     
-                    # Record in history
-                    logger.info(f"Recording history for settlement {settlement_id}")
-                    success = tracker.record_settlement_history({
-                        'settlement_id': str(settlement_id),
-                        'deposit_date': deposit_date,
-                        'date_from': date_from,
-                        'date_to': date_to,
-                        'bank_deposit_amount': float(bank_deposit) if not pd.isna(bank_deposit) else 0.0,
-                        'total_records': len(settlement_rows),
-                        'journal_line_count': len(formatted_journal) if not formatted_journal.empty else 0,
-                        'invoice_line_count': 0,  # Will be calculated if needed
-                        'tax_line_count': tax_count,
-                        'gl_account_totals': gl_totals
-                    })
-                    logger.info(f"History recording result for {settlement_id}: {success}")
-                
-                logger.info("Settlement history recorded for trending analysis")
+                    if tracker.flush():
+                        logger.info("Settlement history recorded for trending analysis")
         except Exception as e:
             import traceback
             logger.warning(f"Could not record settlement history: {e}")
@@ -403,35 +407,38 @@ def main():
         
         # Track processed settlements in Entry_Status.csv
         try:
-            tracker = EntryTracker()
-            # Get unique settlement IDs from the settlements data
-            if settlements_data is not None and 'settlement-id' in settlements_data.columns:
-                settlement_ids = settlements_data['settlement-id'].unique()
-                for settlement_id in settlement_ids:
-                    # Get settlement-specific data
-                    settlement_rows = settlements_data[settlements_data['settlement-id'] == settlement_id]
-                    
-                    # Extract deposit date (from deposit-date column, first non-null value)
-                    deposit_date = ""
-                    if 'deposit-date' in settlement_rows.columns:
-                        deposit_dates = settlement_rows['deposit-date'].dropna()
-                        if len(deposit_dates) > 0:
-                            deposit_date = str(deposit_dates.iloc[0])
-                    
-                    # Extract deposit amount (sum of all amounts for this settlement)
-                    deposit_amount = 0.0
-                    if 'amount' in settlement_rows.columns:
-                        # Sum all amounts for this settlement
-                        amounts = pd.to_numeric(settlement_rows['amount'], errors='coerce')
-                        deposit_amount = amounts.sum()
-                    
-                    tracker.record_processing(
-                        str(settlement_id), 
-                        deposit_date=deposit_date,
-                        deposit_amount=float(deposit_amount),
-                        processed_by="ETL Pipeline"
-                    )
-                logger.info(f"Tracked {len(settlement_ids)} settlement(s) in Entry_Status.csv")
+            with EntryTracker() as tracker:
+                # Get unique settlement IDs from the settlements data
+                if settlements_data is not None and 'settlement-id' in settlements_data.columns:
+                    settlement_ids = settlements_data['settlement-id'].unique()
+                    for settlement_id in settlement_ids:
+                        # Get settlement-specific data
+                        settlement_rows = settlements_data[settlements_data['settlement-id'] == settlement_id]
+                        
+                        # Extract deposit date (from deposit-date column, first non-null value)
+                        deposit_date = ""
+                        if 'deposit-date' in settlement_rows.columns:
+                            deposit_dates = settlement_rows['deposit-date'].dropna()
+                            if len(deposit_dates) > 0:
+                                deposit_date = str(deposit_dates.iloc[0])
+                        
+                        # Extract deposit amount (sum of all amounts for this settlement)
+                        deposit_amount = 0.0
+                        if 'amount' in settlement_rows.columns:
+                            # Sum all amounts for this settlement
+                            amounts = pd.to_numeric(settlement_rows['amount'], errors='coerce')
+                            deposit_amount = amounts.sum()
+                        
+                        tracker.record_processing(
+                            str(settlement_id), 
+                            deposit_date=deposit_date,
+                            deposit_amount=float(deposit_amount),
+                            processed_by="ETL Pipeline"
+                        )
+                    logger.info(f"Tracked {len(settlement_ids)} settlement(s) in Entry_Status.csv")
+            
+            # Regenerate the formatted Entry_Status.xlsx once per run, after the ledger is written
+            tracker.export_xlsx()
         except Exception as e:
             logger.warning(f"Could not update entry tracking: {e}")
         
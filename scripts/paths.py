@@ -28,6 +28,13 @@ def get_zoho_tracking_path() -> Path:
     return base / "zoho_tracking.csv"
 
 
+def get_zoho_tracking_parquet_path() -> Path:
+    """Get path to zoho_tracking.parquet (typed copy of zoho_tracking.csv)"""
+    base = get_sharepoint_base()
+    base.mkdir(parents=True, exist_ok=True)
+    return base / "zoho_tracking.parquet"
+
+
 def get_action_items_path() -> Path:
     """Get path to action_items.csv"""
     base = get_sharepoint_base()
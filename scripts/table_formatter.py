@@ -73,13 +73,11 @@ def format_excel_column_widths(workbook_path: str,
                 column_letter = get_column_letter(column[0].column)
                 
                 for cell in column:
-                    try:
-                        if cell.value:
-                            cell_length = len(str(cell.value))
-                            if cell_length > max_length:
-                                max_length = cell_length
-                    except:
-                        pass
+                    value = cell.value
+                    if value is not None:
+                        cell_length = len(value) if isinstance(value, str) else len(str(value))
+                        if cell_length > max_length:
+                            max_length = cell_length
                 
                 # Set width (with some padding, max 50)
                 adjusted_width = min(max_length + 2, 50)
@@ -9,13 +9,54 @@ Author: ETL Pipeline
 Date: October 2025
 """
 
+from __future__ import annotations
+
 import logging
-import pandas as pd
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Optional
 import os
 
+# pandas and openpyxl are imported inside the methods that need them so that
+# importing this module (and constructing an EntryTracker) stays cheap.
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@lru_cache(maxsize=None)
+def _header_styles():
+    """Header row formatting: Bold white text on a professional blue background, wrapped."""
+    from openpyxl.styles import Font, PatternFill, Alignment
+    
+    return (
+        Font(bold=True, size=11, name='Calibri', color='FFFFFF'),
+        PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid'),
+        Alignment(horizontal='center', vertical='center', wrap_text=True)
+    )
+
+# GL account name -> history column suffix: spaces/dashes to underscores, dots dropped
+GL_COLUMN_TRANSLATION = str.maketrans({' ': '_', '-': '_', '.': None})
+
+
+def _atomic_write(path: Path, write: Callable[[Path], None]):
+    """
+    Write a file via a temp file in the same folder, then rename it over the target.
+    
+    Readers (and OneDrive/SharePoint sync) only ever see the old or the new file,
+    never a partially written one.
+    """
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
 
 class EntryTracker:
     """
@@ -36,20 +77,75 @@ class EntryTracker:
     STATUS_COMPLETE = "Uploaded to Zoho - Complete"
     STATUS_ON_HOLD = "On Hold - Issue Found"
     
-    VALID_STATUSES = [
+    # Dropdown / display order
+    STATUS_ORDER = (
         STATUS_PENDING_APPROVAL,
         STATUS_OUT_OF_BALANCE,
         STATUS_APPROVED,
         STATUS_COMPLETE,
         STATUS_ON_HOLD
+    )
+    
+    VALID_STATUSES = frozenset(STATUS_ORDER)
+    
+    # Excel list-validation formula for the Status column
+    STATUS_FORMULA = '"' + ','.join(STATUS_ORDER) + '"'
+    
+    COLUMNS = [
+        'Settlement_ID',
+        'Deposit_Date',
+        'Deposit_Amount',
+        'Date_Processed',
+        'Processed_By',
+        'Date_Approved',
+        'Approved_By',
+        'Date_Entered_Zoho',
+        'Entered_By',
+        'Status',
+        'Notes'
     ]
     
+    # Timestamps written by the tracker, held as datetime64 rather than strings.
+    # Deposit_Date stays text: it is copied as-is from Amazon's settlement file.
+    LEDGER_DATE_COLUMNS = ['Date_Processed', 'Date_Approved', 'Date_Entered_Zoho']
+    LEDGER_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+    
+    # Remaining ledger columns are text apart from the amount, so empty user/notes
+    # columns aren't read as float
+    LEDGER_DTYPES = {
+        'Settlement_ID': str,
+        'Deposit_Date': str,
+        'Deposit_Amount': float,
+        'Processed_By': str,
+        'Approved_By': str,
+        'Entered_By': str,
+        'Status': str,
+        'Notes': str
+    }
+    
+    # Known settlement_history.csv columns read without type inference. IDs must stay
+    # text: zoho_journal_id exceeds float precision once NaN forces a float column.
+    HISTORY_DTYPES = {
+        'settlement_id': str,
+        'deposit_date': str,
+        'date_from': str,
+        'date_to': str,
+        'date_processed': str,
+        'zoho_journal_id': str,
+        'zoho_sync_date': str,
+        'zoho_sync_status': str
+    }
+    
     def __init__(self, tracking_file: str = None):
         """
         Initialize the EntryTracker.
         
+        The CSV ledger (Entry_Status.csv) is the source of truth for all reads
+        and writes. The formatted Entry_Status.xlsx next to it is a view that is
+        only regenerated by export_xlsx().
+        
         Args:
-            tracking_file: Path to Entry_Status.csv. If None, uses default SharePoint location.
+            tracking_file: Path to Entry_Status.xlsx (or .csv). If None, uses default SharePoint location.
         """
         self.logger = logging.getLogger(__name__)
         
@@ -60,74 +156,316 @@ class EntryTracker:
             ))
             self.tracking_file = sharepoint_base / "Entry_Status.xlsx"
         else:
-            self.tracking_file = Path(tracking_file)
+            self.tracking_file = Path(tracking_file).with_suffix('.xlsx')
+        
+        # Authoritative ledger lives next to the workbook
+        self._ledger = self.tracking_file.with_suffix('.csv')
+        
+        # Settlement history rows queued until flush(), keyed by settlement_id
+        self._pending_history = {}
+        
+        # In-memory copy of the ledger, invalidated when the file's mtime changes
+        self._cached_df = None
+        self._cached_mtime = None
+        self._id_to_idx = {}
+        
+        # Inside a `with EntryTracker() as tracker:` block ledger writes are deferred to __exit__
+        self._batch_mode = False
+        self._dirty = False
+        self._batch_ids = set()  # settlements changed by the current batch
         
-        # Ensure file exists with headers
+        # Lock file guarding read-modify-write of the ledger across concurrent runs
+        self._lock_file = self._ledger.with_name(self._ledger.name + '.lock')
+        self._lock_depth = 0
+        
+        # Ensure ledger and workbook exist with headers
+        if not self._ledger.exists():
+            self._create_ledger()
         if not self.tracking_file.exists():
             self._create_tracking_file()
     
-    def _create_tracking_file(self):
-        """Create tracking file with headers if it doesn't exist."""
-        from openpyxl import Workbook
-        from openpyxl.worksheet.datavalidation import DataValidation
+    def _create_ledger(self):
+        """Create the CSV ledger, seeding it from an existing workbook if present."""
+        import pandas as pd
         
-        headers = [
-            'Settlement_ID',
-            'Deposit_Date',
-            'Deposit_Amount',
-            'Date_Processed',
-            'Processed_By',
-            'Date_Approved',
-            'Approved_By',
-            'Date_Entered_Zoho',
-            'Entered_By',
-            'Status',
-            'Notes'
-        ]
-        
-        # Create Excel file with data validation
-        df = pd.DataFrame(columns=headers)
-        df.to_excel(self.tracking_file, index=False, sheet_name='Entry Status', engine='openpyxl')
+        df = pd.DataFrame(columns=self.COLUMNS)
+        if self.tracking_file.exists():
+            try:
+                df = self._read_tracking_workbook()
+                self.logger.info(f"Migrating tracking data from {self.tracking_file}")
+            except Exception as e:
+                self.logger.warning(f"Could not read existing tracking workbook, starting empty: {e}")
+        self._save_df(df)
+        # Re-read on first use so the cached frame gets the ledger dtypes
+        self._invalidate_cache()
+        self.logger.info(f"Created tracking ledger: {self._ledger}")
+    
+    def _read_tracking_workbook(self) -> pd.DataFrame:
+        """Read values from Entry_Status.xlsx, preferring the calamine engine over openpyxl."""
+        import pandas as pd
         
-        # Add dropdown validation for Status column
-        from openpyxl import load_workbook
-        wb = load_workbook(self.tracking_file)
-        ws = wb.active
-        
-        status_options = (
-            '"Processed - Pending Approval,'
-            'Requires Review - Out of Balance,'
-            'Approved - Ready for Zoho,'
-            'Uploaded to Zoho - Complete,'
-            'On Hold - Issue Found"'
+        try:
+            return pd.read_excel(self.tracking_file, engine='calamine', dtype={'Settlement_ID': 'string'})
+        except ImportError:
+            # python-calamine not installed
+            return pd.read_excel(self.tracking_file, engine='openpyxl', dtype={'Settlement_ID': 'string'})
+    
+    def _load_df(self) -> pd.DataFrame:
+        """
+        Load the tracking ledger, reusing the cached frame while the file is unchanged.
+        
+        Callers that modify the returned frame must pass it to _save_df().
+        """
+        import pandas as pd
+        
+        if self._batch_mode and self._cached_df is not None:
+            # Unsaved batch edits are authoritative until __exit__
+            return self._cached_df
+        
+        mtime = self._ledger.stat().st_mtime_ns
+        if self._cached_df is not None and mtime == self._cached_mtime:
+            return self._cached_df
+        
+        df = pd.read_csv(self._ledger, dtype=self.LEDGER_DTYPES)
+        for col in self.LEDGER_DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce')
+        
+        # Categorical Status so the get_pending_* filters compare int codes, not strings.
+        # Statuses typed by hand outside STATUS_ORDER are kept as extra categories.
+        extra = sorted(set(df['Status'].dropna()) - self.VALID_STATUSES)
+        df['Status'] = df['Status'].astype(pd.CategoricalDtype(list(self.STATUS_ORDER) + extra))
+        
+        self._cached_df = df
+        self._cached_mtime = mtime
+        self._build_id_index(self._cached_df)
+        return self._cached_df
+    
+    def _build_id_index(self, df: pd.DataFrame):
+        """Map Settlement_ID to its row label (first occurrence wins)."""
+        ids = df['Settlement_ID'].astype(str).tolist()
+        self._id_to_idx = dict(zip(reversed(ids), reversed(df.index.tolist())))
+    
+    def _save_df(self, df: pd.DataFrame, settlement_id: str = None):
+        """
+        Write the tracking ledger (deferred in batch mode) and keep it as the cached frame.
+        
+        Args:
+            df: Full ledger frame
+            settlement_id: Settlement whose row was changed (recorded for the batch merge)
+        """
+        self._cached_df = df
+        self._build_id_index(df)
+        if self._batch_mode:
+            self._dirty = True
+            if settlement_id is not None:
+                self._batch_ids.add(str(settlement_id))
+            return
+        _atomic_write(self._ledger, lambda tmp: df.to_csv(tmp, index=False, date_format=self.LEDGER_DATE_FORMAT))
+        self._cached_mtime = self._ledger.stat().st_mtime_ns
+    
+    def _append_row(self, row: dict):
+        """Append a single record to the tracking ledger without rewriting it."""
+        import pandas as pd
+        
+        if self._batch_mode:
+            self._load_df()
+            self._append_cached(row)
+            self._dirty = True
+            self._batch_ids.add(str(row['Settlement_ID']))
+            return
+        
+        cached = self._cached_df is not None and self._ledger.stat().st_mtime_ns == self._cached_mtime
+        pd.DataFrame([row], columns=self.COLUMNS).to_csv(
+            self._ledger, mode='a', header=False, index=False, date_format=self.LEDGER_DATE_FORMAT
         )
+        if cached:
+            self._append_cached(row)
+            self._cached_mtime = self._ledger.stat().st_mtime_ns
+        else:
+            self._invalidate_cache()
+    
+    def _append_cached(self, row: dict):
+        """Add a record to the cached ledger frame, keeping its column dtypes."""
+        import pandas as pd
+        
+        df = self._cached_df
+        idx = len(df)
+        row_df = pd.DataFrame([row], columns=self.COLUMNS, index=[idx]).astype(df.dtypes.to_dict())
+        self._cached_df = pd.concat([df, row_df])
+        self._id_to_idx.setdefault(str(row['Settlement_ID']), idx)
+    
+    def _invalidate_cache(self):
+        """Force the next _load_df() to re-read the ledger."""
+        if self._dirty:
+            # Don't throw away unsaved batch edits
+            return
+        self._cached_df = None
+        self._cached_mtime = None
+        self._id_to_idx = {}
+    
+    @contextmanager
+    def _ledger_lock(self, timeout: float = 30.0, stale_after: float = 120.0):
+        """
+        Hold an exclusive lock file around a ledger read-modify-write.
+        
+        Re-entrant within one tracker. The lock file holds an owner token and is only
+        removed by its owner. A lock file not modified for `stale_after` seconds is
+        assumed to be left behind by a crashed run and is taken over; ledger updates
+        hold the lock for well under that.
+        
+        Raises:
+            TimeoutError: If another run still holds the lock after `timeout` seconds
+        """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        
+        token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(self._lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                owner = self._lock_owner()
+                try:
+                    age = time.time() - self._lock_file.stat().st_mtime
+                except FileNotFoundError:
+                    continue  # released meanwhile
+                if age > stale_after:
+                    self.logger.warning(f"Taking over stale tracking lock ({owner}): {self._lock_file}")
+                    self._release_lock(owner)
+                elif time.monotonic() > deadline:
+                    raise TimeoutError(f"Tracking ledger is locked by another run ({owner}): {self._lock_file}")
+                else:
+                    time.sleep(0.1)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(token)
+            break
         
+        self._lock_depth = 1
+        try:
+            yield
+        finally:
+            self._lock_depth = 0
+            self._release_lock(token)
+    
+    def _lock_owner(self) -> Optional[str]:
+        """Owner token in the ledger lock file (None if there is no lock)."""
+        try:
+            return self._lock_file.read_text()
+        except FileNotFoundError:
+            return None
+    
+    def _release_lock(self, token: Optional[str]):
+        """Remove the ledger lock file, but only while it still holds `token`."""
+        if self._lock_owner() != token:
+            return
+        try:
+            os.remove(self._lock_file)
+        except FileNotFoundError:
+            pass
+    
+    def __enter__(self):
+        """Batch tracker updates: ledger changes are written once on exit."""
+        self._batch_mode = True
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Write batched ledger changes and any queued settlement history."""
+        self._batch_mode = False
+        if self._dirty:
+            self._dirty = False
+            try:
+                # The lock is only held for the write, not for the whole batch
+                with self._ledger_lock():
+                    self._save_batch()
+            except Exception as e:
+                self._invalidate_cache()
+                self.logger.error(f"Error writing batched tracking updates: {e}")
+        self._batch_ids = set()
+        self.flush()
+        return False
+    
+    def _save_batch(self):
+        """
+        Write the batched ledger frame.
+        
+        If another run changed the ledger since the batch loaded it, the rows of the
+        settlements this batch changed are applied onto the current ledger instead,
+        so the other run's updates are kept.
+        """
+        import pandas as pd
+        
+        df = self._cached_df
+        if self._ledger.stat().st_mtime_ns == self._cached_mtime:
+            self._save_df(df)
+            return
+        
+        batch_idx = self._id_to_idx
+        changed = sorted(self._batch_ids, key=batch_idx.get)
+        self._cached_df = None
+        current = self._load_df().copy()
+        new_rows = []
+        for settlement_id in changed:
+            idx = self._id_to_idx.get(settlement_id)
+            if idx is None:
+                new_rows.append(batch_idx[settlement_id])
+            else:
+                current.loc[idx] = df.loc[batch_idx[settlement_id]]
+        if new_rows:
+            current = pd.concat([current, df.loc[new_rows]], ignore_index=True)
+        self.logger.info(f"Tracking ledger changed during batch - merged {len(changed)} settlement(s)")
+        self._save_df(current)
+        # Re-read on next use so the cached frame gets the ledger dtypes
+        self._invalidate_cache()
+    
+    def export_xlsx(self):
+        """
+        Regenerate the formatted Entry_Status.xlsx view from the ledger.
+        
+        Status updates only touch the CSV ledger, so call this once after a batch of
+        updates (the pipeline does so at the end of each run). Header styling and the
+        Status dropdown are rebuilt every time.
+        """
+        try:
+            self._create_tracking_file(self._load_df())
+        except Exception as e:
+            self.logger.error(f"Error exporting tracking workbook: {e}")
+    
+    def _create_tracking_file(self, df: Optional[pd.DataFrame] = None):
+        """Create the formatted tracking workbook, optionally filled with ledger rows."""
+        import pandas as pd
+        from openpyxl import Workbook, LXML
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.worksheet.datavalidation import DataValidation
+        
+        if not LXML:
+            self.logger.warning("lxml not installed - tracking workbook will be written more slowly")
+        
+        if df is None:
+            df = pd.DataFrame(columns=self.COLUMNS)
+        
+        # Single write-only pass: no to_excel + load_workbook round-trip
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Entry Status')
+        
+        # Add dropdown validation for Status column
         dv = DataValidation(
             type="list",
-            formula1=status_options,
+            formula1=self.STATUS_FORMULA,
             allow_blank=True
         )
         dv.error = 'Invalid status selected'
         dv.errorTitle = 'Invalid Entry'
         dv.prompt = 'Please select a status from the dropdown'
         dv.promptTitle = 'Status Selection'
-        dv.add('J2:J1000')
-        ws.add_data_validation(dv)
-        
-        # Professional formatting for headers
-        from openpyxl.styles import Font, PatternFill, Alignment
-        
-        # Header row formatting: Bold, larger font, background color, wrapped text
-        header_font = Font(bold=True, size=11, name='Calibri')
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')  # Professional blue
-        header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            # Make text white for better contrast on blue background
-            cell.font = Font(bold=True, size=11, name='Calibri', color='FFFFFF')
+        dv.add(f'J2:J{max(1000, len(df) + 1)}')
+        ws.data_validations.append(dv)
         
         # Increase header row height for wrapped text
         ws.row_dimensions[1].height = 30
@@ -153,8 +491,23 @@ class EntryTracker:
         # Freeze the header row so it stays visible when scrolling
         ws.freeze_panes = 'A2'
         
-        wb.save(self.tracking_file)
-        self.logger.info(f"Created tracking file: {self.tracking_file}")
+        # Professional formatting for headers
+        header_font, header_fill, header_alignment = _header_styles()
+        header_cells = []
+        for header in df.columns:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+            header_cells.append(cell)
+        ws.append(header_cells)
+        
+        # Data rows (blank cells instead of NaN)
+        for row in df.astype(object).where(df.notna(), None).itertuples(index=False):
+            ws.append(list(row))
+        
+        _atomic_write(self.tracking_file, wb.save)
+        self.logger.info(f"Wrote tracking file: {self.tracking_file}")
     
     def record_processing(self, settlement_id: str, deposit_date: str = "", deposit_amount: float = 0.0, 
                          processed_by: str = "ETL Pipeline", notes: str = ""):
@@ -168,46 +521,69 @@ class EntryTracker:
             processed_by: Who/what processed it (default: "ETL Pipeline")
             notes: Optional notes about the processing
         """
+        import pandas as pd
+        
         try:
-            # Load existing tracking data
-            df = pd.read_excel(self.tracking_file, engine='openpyxl')
-            
-            # Check if this settlement already exists
-            existing = df[df['Settlement_ID'] == settlement_id]
-            
-            if len(existing) > 0:
-                # Update existing record
-                idx = existing.index[0]
-                df.loc[idx, 'Deposit_Date'] = deposit_date
-                df.loc[idx, 'Deposit_Amount'] = deposit_amount
-                df.loc[idx, 'Date_Processed'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                df.loc[idx, 'Processed_By'] = processed_by
-                df.loc[idx, 'Status'] = self.STATUS_PENDING_APPROVAL
-                if notes:
-                    df.loc[idx, 'Notes'] = notes
-                self.logger.info(f"Updated tracking for settlement {settlement_id}")
-            else:
-                # Add new record
-                new_row = {
-                    'Settlement_ID': settlement_id,
-                    'Deposit_Date': deposit_date,
-                    'Deposit_Amount': deposit_amount,
-                    'Date_Processed': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'Processed_By': processed_by,
-                    'Date_Approved': '',
-                    'Approved_By': '',
-                    'Date_Entered_Zoho': '',
-                    'Entered_By': '',
-                    'Status': 'Processed - Pending Approval',
-                    'Notes': notes
-                }
-                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                self.logger.info(f"Added tracking for settlement {settlement_id}")
-            
-            # Save updated tracking file
-            df.to_excel(self.tracking_file, index=False, sheet_name='Entry Status', engine='openpyxl')
+            now = pd.Timestamp.now().floor('s')
             
+            with self._ledger_lock():
+                # Load existing tracking data
+                df = self._load_df()
+                
+                # Check if this settlement already exists
+                idx = self._id_to_idx.get(str(settlement_id))
+                
+                if idx is not None:
+                    # Idempotent re-run: skip the write when nothing would change
+                    proposed = {
+                        'Deposit_Date': deposit_date,
+                        'Deposit_Amount': deposit_amount,
+                        'Processed_By': processed_by,
+                        'Status': self.STATUS_PENDING_APPROVAL
+                    }
+                    if notes:
+                        proposed['Notes'] = notes
+                    current = df.loc[idx, list(proposed)]
+                    if all(
+                        (pd.isna(current[col]) and val in ('', None)) or current[col] == val
+                        for col, val in proposed.items()
+                    ):
+                        self.logger.info(f"No change for settlement {settlement_id}")
+                        return
+                    
+                    # Update existing record
+                    df.at[idx, 'Deposit_Date'] = deposit_date
+                    df.at[idx, 'Deposit_Amount'] = deposit_amount
+                    df.at[idx, 'Date_Processed'] = now
+                    df.at[idx, 'Processed_By'] = processed_by
+                    df.at[idx, 'Status'] = self.STATUS_PENDING_APPROVAL
+                    if notes:
+                        df.at[idx, 'Notes'] = notes
+                    self.logger.info(f"Updated tracking for settlement {settlement_id}")
+                else:
+                    # Add new record
+                    new_row = {
+                        'Settlement_ID': settlement_id,
+                        'Deposit_Date': deposit_date,
+                        'Deposit_Amount': deposit_amount,
+                        'Date_Processed': now,
+                        'Processed_By': processed_by,
+                        'Date_Approved': None,
+                        'Approved_By': '',
+                        'Date_Entered_Zoho': None,
+                        'Entered_By': '',
+                        'Status': self.STATUS_PENDING_APPROVAL,
+                        'Notes': notes
+                    }
+                    self._append_row(new_row)
+                    self.logger.info(f"Added tracking for settlement {settlement_id}")
+                    return
+                
+                # Save updated tracking ledger
+                self._save_df(df, settlement_id)
+                
         except Exception as e:
+            self._invalidate_cache()
             self.logger.error(f"Error recording processing for {settlement_id}: {e}")
     
     def mark_approved(self, settlement_id: str, approved_by: str, notes: str = ""):
@@ -219,26 +595,31 @@ class EntryTracker:
             approved_by: Who approved it
             notes: Optional approval notes
         """
+        import pandas as pd
+        
         try:
-            df = pd.read_excel(self.tracking_file, engine='openpyxl')
-            existing = df[df['Settlement_ID'] == settlement_id]
-            
-            if len(existing) == 0:
-                self.logger.warning(f"Settlement {settlement_id} not found in tracking")
-                return
-            
-            idx = existing.index[0]
-            df.loc[idx, 'Date_Approved'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            df.loc[idx, 'Approved_By'] = approved_by
-            df.loc[idx, 'Status'] = self.STATUS_APPROVED
-            if notes:
-                current_notes = df.loc[idx, 'Notes']
-                df.loc[idx, 'Notes'] = f"{current_notes}; {notes}" if current_notes else notes
-            
-            df.to_excel(self.tracking_file, index=False, sheet_name='Entry Status', engine='openpyxl')
-            self.logger.info(f"Marked settlement {settlement_id} as approved")
+            now = pd.Timestamp.now().floor('s')
             
+            with self._ledger_lock():
+                df = self._load_df()
+                idx = self._id_to_idx.get(str(settlement_id))
+                
+                if idx is None:
+                    self.logger.warning(f"Settlement {settlement_id} not found in tracking")
+                    return
+                
+                df.at[idx, 'Date_Approved'] = now
+                df.at[idx, 'Approved_By'] = approved_by
+                df.at[idx, 'Status'] = self.STATUS_APPROVED
+                if notes:
+                    current_notes = df.at[idx, 'Notes']
+                    df.at[idx, 'Notes'] = f"{current_notes}; {notes}" if pd.notna(current_notes) and current_notes else notes
+                
+                self._save_df(df, settlement_id)
+                self.logger.info(f"Marked settlement {settlement_id} as approved")
+                
         except Exception as e:
+            self._invalidate_cache()
             self.logger.error(f"Error marking approval for {settlement_id}: {e}")
     
     def mark_entered_zoho(self, settlement_id: str, entered_by: str, notes: str = ""):
@@ -250,26 +631,31 @@ class EntryTracker:
             entered_by: Who entered it (or "Zoho API" for automated)
             notes: Optional entry notes
         """
+        import pandas as pd
+        
         try:
-            df = pd.read_excel(self.tracking_file, engine='openpyxl')
-            existing = df[df['Settlement_ID'] == settlement_id]
-            
-            if len(existing) == 0:
-                self.logger.warning(f"Settlement {settlement_id} not found in tracking")
-                return
-            
-            idx = existing.index[0]
-            df.loc[idx, 'Date_Entered_Zoho'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            df.loc[idx, 'Entered_By'] = entered_by
-            df.loc[idx, 'Status'] = self.STATUS_COMPLETE
-            if notes:
-                current_notes = df.loc[idx, 'Notes']
-                df.loc[idx, 'Notes'] = f"{current_notes}; {notes}" if current_notes else notes
-            
-            df.to_excel(self.tracking_file, index=False, sheet_name='Entry Status', engine='openpyxl')
-            self.logger.info(f"Marked settlement {settlement_id} as entered in Zoho")
+            now = pd.Timestamp.now().floor('s')
             
+            with self._ledger_lock():
+                df = self._load_df()
+                idx = self._id_to_idx.get(str(settlement_id))
+                
+                if idx is None:
+                    self.logger.warning(f"Settlement {settlement_id} not found in tracking")
+                    return
+                
+                df.at[idx, 'Date_Entered_Zoho'] = now
+                df.at[idx, 'Entered_By'] = entered_by
+                df.at[idx, 'Status'] = self.STATUS_COMPLETE
+                if notes:
+                    current_notes = df.at[idx, 'Notes']
+                    df.at[idx, 'Notes'] = f"{current_notes}; {notes}" if pd.notna(current_notes) and current_notes else notes
+                
+                self._save_df(df, settlement_id)
+                self.logger.info(f"Marked settlement {settlement_id} as entered in Zoho")
+                
         except Exception as e:
+            self._invalidate_cache()
             self.logger.error(f"Error marking Zoho entry for {settlement_id}: {e}")
     
     def get_status(self, settlement_id: str) -> Optional[dict]:
@@ -283,13 +669,13 @@ class EntryTracker:
             Dictionary with status info, or None if not found
         """
         try:
-            df = pd.read_excel(self.tracking_file, engine='openpyxl')
-            existing = df[df['Settlement_ID'] == settlement_id]
+            df = self._load_df()
+            idx = self._id_to_idx.get(str(settlement_id))
             
-            if len(existing) == 0:
+            if idx is None:
                 return None
             
-            return existing.iloc[0].to_dict()
+            return df.loc[idx].to_dict()
             
         except Exception as e:
             self.logger.error(f"Error getting status for {settlement_id}: {e}")
@@ -297,8 +683,10 @@ class EntryTracker:
     
     def get_pending_approval(self) -> pd.DataFrame:
         """Get all settlements pending approval."""
+        import pandas as pd
+        
         try:
-            df = pd.read_excel(self.tracking_file, engine='openpyxl')
+            df = self._load_df()
             return df[df['Status'] == self.STATUS_PENDING_APPROVAL]
         except Exception as e:
             self.logger.error(f"Error getting pending approvals: {e}")
@@ -306,8 +694,10 @@ class EntryTracker:
     
     def get_pending_zoho_entry(self) -> pd.DataFrame:
         """Get all settlements approved but not yet entered in Zoho."""
+        import pandas as pd
+        
         try:
-            df = pd.read_excel(self.tracking_file, engine='openpyxl')
+            df = self._load_df()
             return df[df['Status'] == self.STATUS_APPROVED]
         except Exception as e:
             self.logger.error(f"Error getting pending Zoho entries: {e}")
@@ -318,6 +708,8 @@ class EntryTracker:
         Record settlement details to historical log (append-only CSV).
         Used for trending, analysis, and financial reporting.
         
+        Rows are queued in memory; call flush() to write them to the history file.
+        
         Args:
             settlement_data: Dictionary with keys:
                 - settlement_id
@@ -335,12 +727,9 @@ class EntryTracker:
         Returns:
             True if successful, False otherwise
         """
+        import pandas as pd
+        
         try:
-            # Save to SharePoint location
-            from paths import get_settlement_history_path
-            history_file = get_settlement_history_path()
-            history_file.parent.mkdir(exist_ok=True)
-            
             # Flatten GL account totals into separate columns
             row_data = {
                 'settlement_id': settlement_data.get('settlement_id'),
@@ -362,47 +751,121 @@ class EntryTracker:
             
             # Add GL account totals as individual columns
             gl_totals = settlement_data.get('gl_account_totals', {})
-            for gl_account, amount in gl_totals.items():
-                # Clean GL account name for column name
-                col_name = f"gl_{gl_account.replace(' ', '_').replace('.', '').replace('-', '_')}"
-                # Ensure amount is a valid number
-                try:
-                    row_data[col_name] = float(amount) if pd.notna(amount) else 0.0
-                except (ValueError, TypeError):
-                    row_data[col_name] = 0.0
+            if gl_totals:
+                # Ensure amounts are valid numbers (invalid/missing -> 0.0)
+                amounts = pd.to_numeric(pd.Series(gl_totals, dtype=object), errors='coerce').fillna(0.0).astype(float)
+                # Clean GL account names for column names in one pass
+                amounts.index = 'gl_' + amounts.index.astype(str).str.translate(GL_COLUMN_TRANSLATION)
+                row_data.update(amounts.to_dict())
+            
+            # Queue for a single write in flush(); a later call for the same settlement wins
+            self._pending_history[str(row_data['settlement_id'])] = row_data
+            self.logger.info(f"Settlement history queued for {settlement_data.get('settlement_id')}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error recording settlement history: {e}")
+            return False
+    
+    def flush(self) -> bool:
+        """
+        Write all queued settlement history rows in a single pass.
+        
+        Returns:
+            True if successful (or nothing was queued), False otherwise
+        """
+        import pandas as pd
+        
+        if not self._pending_history:
+            return True
+        
+        try:
+            # Save to SharePoint location
+            from paths import get_settlement_history_path
+            history_file = get_settlement_history_path()
+            history_file.parent.mkdir(exist_ok=True)
+            
+            # Fast path: only brand-new settlements whose columns already exist are
+            # appended in place, without parsing or rewriting the existing history
+            if self._append_history(history_file):
+                self.logger.info(f"Settlement history appended for {len(self._pending_history)} settlement(s)")
+                self._pending_history.clear()
+                return True
+            
+            new_rows = []
+            df = None
             
             # Load existing history or create new
             if history_file.exists():
                 try:
-                    df = pd.read_csv(history_file)
-                    # Check if settlement already exists
-                    if settlement_data.get('settlement_id') in df['settlement_id'].values:
-                        # Update existing record
-                        mask = df['settlement_id'] == settlement_data.get('settlement_id')
-                        for col, val in row_data.items():
-                            if col in df.columns:
-                                df.loc[mask, col] = val
-                            else:
-                                df[col] = None
-                                df.loc[mask, col] = val
-                    else:
-                        # Append new record
-                        df = pd.concat([df, pd.DataFrame([row_data])], ignore_index=True)
+                    df = pd.read_csv(history_file, dtype=self.HISTORY_DTYPES)
                 except Exception as e:
                     self.logger.warning(f"Could not load existing history, creating new: {e}")
-                    df = pd.DataFrame([row_data])
-            else:
-                df = pd.DataFrame([row_data])
+                    df = None
+            
+            for settlement_id, row_data in self._pending_history.items():
+                # Check if settlement already exists
+                if df is not None and settlement_id in df['settlement_id'].values:
+                    # Update existing record in one assignment, adding any new GL columns first
+                    mask = df['settlement_id'] == settlement_id
+                    missing_cols = [col for col in row_data if col not in df.columns]
+                    if missing_cols:
+                        df = df.reindex(columns=list(df.columns) + missing_cols)
+                    df.loc[mask, list(row_data)] = list(row_data.values())
+                else:
+                    # Append new record
+                    new_rows.append(row_data)
+            
+            # One concat for all new settlements instead of one per row
+            if new_rows:
+                new_df = pd.DataFrame(new_rows)
+                df = new_df if df is None else pd.concat([df, new_df], ignore_index=True)
             
             # Save to CSV
-            df.to_csv(history_file, index=False)
-            self.logger.info(f"Settlement history recorded for {settlement_data.get('settlement_id')}")
+            _atomic_write(history_file, lambda tmp: df.to_csv(tmp, index=False))
+            self.logger.info(f"Settlement history recorded for {len(self._pending_history)} settlement(s)")
+            self._pending_history.clear()
             return True
             
         except Exception as e:
             self.logger.error(f"Error recording settlement history: {e}")
             return False
 
+    
+    def _append_history(self, history_file: Path) -> bool:
+        """
+        Append queued history rows to the end of the file when no rewrite is needed.
+        
+        Only the header and the settlement_id column are read. Returns False (nothing
+        written) if a queued settlement already exists, a queued row introduces a new
+        column, or the file doesn't end cleanly with a newline.
+        
+        The history stays a single CSV (not a partitioned Parquet dataset) because the
+        sync, reporting and verification scripts and the SharePoint users read
+        settlement_history.csv directly.
+        """
+        import pandas as pd
+        
+        if not history_file.exists() or history_file.stat().st_size == 0:
+            return False
+        
+        with open(history_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                return False
+        
+        header = pd.read_csv(history_file, nrows=0).columns
+        new_df = pd.DataFrame(list(self._pending_history.values()))
+        if not set(new_df.columns).issubset(header):
+            return False
+        
+        existing_ids = pd.read_csv(history_file, usecols=['settlement_id'], dtype={'settlement_id': str})['settlement_id']
+        if existing_ids.isin(self._pending_history.keys()).any():
+            return False
+        
+        new_df.reindex(columns=header).to_csv(history_file, mode='a', header=False, index=False)
+        return True
+
 
 if __name__ == "__main__":
     # Example usage
@@ -420,3 +883,6 @@ if __name__ == "__main__":
     
     # Example: Mark entered in Zoho
     tracker.mark_entered_zoho("12345678901", "John Doe", "All entries posted")
+    
+    # Example: Regenerate the formatted Entry_Status.xlsx view
+    tracker.export_xlsx()
@@ -16,14 +16,43 @@ Author: ETL Pipeline
 Date: October 2025
 """
 
+import csv
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Union
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+# Column name normalization: any run of non-word characters and underscores
+# collapses to a single underscore, compiled once per process
+_SEPARATOR_RUN_RE = re.compile(r'[\W_]+')
+
+# Currency symbols stripped from amount text before numeric parsing
+_CURRENCY_RE = re.compile(r'[$€£]')
+
+# Low-cardinality settlement columns stored as category (integer codes instead of
+# one string object per row). Columns that exports group or value_count on
+# (transaction_type, currency, marketplace_name) stay as strings so unobserved
+# categories never appear in those results.
+_CATEGORY_COLUMNS = ['data_source', 'price_type', 'other_fee_reason_description']
+
+# Strings pandas' read_csv treats as missing, so the pyarrow reader agrees with it
+_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
 
 class DataTransformer:
     """
@@ -36,6 +65,19 @@ class DataTransformer:
     - Merge data from multiple sources
     """
     
+    # Columns selected for the journal export (include all M Code calculated fields).
+    # Invoice and payment frames are trimmed to these (plus order_id) before merging,
+    # since nothing else from them reaches an export.
+    JOURNAL_COLUMNS = [
+        'settlement_id', 'order_id', 'merchant_order_id', 'transaction_type', 
+        'posted_date', 'deposit_date', 'total_amount', 'currency',
+        'transaction_amount', 'tax_amount', 'row_id', 'item_price_lookup',
+        'shipment_fee_type', 'order_fee_type', 'item_related_fee_type',
+        'other_fee_reason_description', 'promotion_type', 'price_type',
+        'marketplace_name', 'sku', 'quantity_purchased', 'price_amount',
+        'data_source', 'source_file'
+    ]
+    
     def __init__(self, config: Dict[str, Any]):
         """
         Initialize the DataTransformer with configuration settings.
@@ -52,6 +94,10 @@ class DataTransformer:
         self.invoices_path = self.raw_data_path / config['inputs']['invoices']
         self.payments_path = self.raw_data_path / config['inputs']['payments']
         
+        # Optional Parquet checkpoints of each processed dataset
+        self.use_checkpoints = config.get('options', {}).get('use_parquet_checkpoints', False)
+        self.checkpoint_path = Path(config['paths'].get('outputs', './outputs')) / 'checkpoints'
+        
         self.logger.info("DataTransformer initialized")
     
     def normalize_column_names(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -73,29 +119,17 @@ class DataTransformer:
         if df.empty:
             return df
             
-        # Create a copy to avoid modifying original
-        normalized_df = df.copy()
-        
-        # Normalize column names
-        new_columns = []
-        for col in normalized_df.columns:
-            # Convert to string and strip whitespace
-            normalized_col = str(col).strip()
-            
-            # Convert to lowercase
-            normalized_col = normalized_col.lower()
-            
-            # Replace spaces, hyphens, and special characters with underscores
-            normalized_col = re.sub(r'[^\w]', '_', normalized_col)
-            
-            # Remove multiple consecutive underscores
-            normalized_col = re.sub(r'_+', '_', normalized_col)
-            
-            # Remove leading/trailing underscores
-            normalized_col = normalized_col.strip('_')
-            
-            new_columns.append(normalized_col)
+        # Normalize all column names in one vectorized pass over the Index
+        new_columns = (
+            df.columns.astype(str)
+            .str.strip()
+            .str.lower()
+            .str.replace(_SEPARATOR_RUN_RE, '_', regex=True)
+            .str.strip('_')
+        )
         
+        # Renaming does not touch the data, so a shallow copy is enough
+        normalized_df = df.copy(deep=False)
         normalized_df.columns = new_columns
         
         self.logger.debug(f"Column names normalized: {dict(zip(df.columns, new_columns))}")
@@ -112,7 +146,7 @@ class DataTransformer:
         4. Removes or replaces invalid values
         
         Args:
-            df: Input DataFrame
+            df: Input DataFrame (left unmodified)
             
         Returns:
             DataFrame with cleaned data values
@@ -120,20 +154,25 @@ class DataTransformer:
         if df.empty:
             return df
             
-        cleaned_df = df.copy()
+        # Columns are replaced, never written in place, so a shallow copy is enough
+        cleaned_df = df.copy(deep=False)
         
         # Clean string columns: trim whitespace
-        string_columns = cleaned_df.select_dtypes(include=['object']).columns
-        for col in string_columns:
-            cleaned_df[col] = cleaned_df[col].astype(str).str.strip()
-            # Replace 'nan' strings with actual NaN
-            cleaned_df[col] = cleaned_df[col].replace('nan', np.nan)
+        # Files are read with dtype=str, so values are already strings or NaN
+        # and can be stripped without an astype(str) round-trip
+        string_columns = cleaned_df.select_dtypes(include=['object', 'string']).columns
+        if len(string_columns):
+            cleaned_df[string_columns] = (
+                cleaned_df[string_columns]
+                .apply(lambda col: col.str.strip())
+                # Replace 'nan' strings with actual NaN
+                .replace('nan', np.nan)
+            )
         
-        # Clean numeric columns: handle invalid values
+        # Clean numeric columns: replace inf and -inf with NaN in one block
         numeric_columns = cleaned_df.select_dtypes(include=[np.number]).columns
-        for col in numeric_columns:
-            # Replace inf and -inf with NaN
-            cleaned_df[col] = cleaned_df[col].replace([np.inf, -np.inf], np.nan)
+        if len(numeric_columns):
+            cleaned_df[numeric_columns] = cleaned_df[numeric_columns].replace([np.inf, -np.inf], np.nan)
         
         self.logger.debug(f"Data values cleaned for {len(cleaned_df)} rows")
         return cleaned_df
@@ -162,16 +201,51 @@ class DataTransformer:
         
         self.logger.info(f"Found {len(data_files)} files in {folder_path}")
         
-        # Read and combine all files
-        dataframes = []
-        for file_path in data_files:
+        # Read files concurrently; pandas and pyarrow release the GIL while parsing
+        with ThreadPoolExecutor(max_workers=min(8, len(data_files))) as executor:
+            results = list(executor.map(self._read_one, data_files))
+        dataframes = [data for data in results if data is not None]
+        
+        if not dataframes:
+            self.logger.warning("No data files could be read successfully")
+            return None
+        
+        # Combine all dataframes. When every file came through pyarrow, the
+        # tables are concatenated without copying and converted to pandas once.
+        if all(isinstance(data, pd.DataFrame) for data in dataframes):
+            combined_df = pd.concat(dataframes, ignore_index=True)
+        elif not any(isinstance(data, pd.DataFrame) for data in dataframes):
+            combined_df = self._table_to_frame(pa.concat_tables(dataframes, promote_options='default'))
+        else:
+            combined_df = pd.concat(
+                [data if isinstance(data, pd.DataFrame) else self._table_to_frame(data) for data in dataframes],
+                ignore_index=True
+            )
+        self.logger.info(f"Combined {len(dataframes)} files into {len(combined_df)} total rows")
+        
+        return combined_df
+    
+    def _read_one(self, file_path: Path) -> Optional[Union[pd.DataFrame, 'pa.Table']]:
+        """
+        Read a single data file and tag it with its source file name.
+        
+        Args:
+            file_path: Path to the data file
+            
+        Returns:
+            pyarrow Table or DataFrame, or None if the file could not be read
+        """
+        try:
+            self.logger.debug(f"Reading file: {file_path}")
+            
+            # Detect the delimiter from a 64KB sample rather than the header alone
+            with open(file_path, 'rb') as f:
+                sample = f.read(64 * 1024).decode('utf-8-sig', errors='replace')
+            first_line = sample.split('\n', 1)[0].rstrip('\r')
+            
             try:
-                self.logger.debug(f"Reading file: {file_path}")
-                
-                # Try to detect delimiter (tab or comma)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    first_line = f.readline().strip()
-                
+                delimiter = csv.Sniffer().sniff(sample, delimiters='\t,;|').delimiter
+            except csv.Error:
                 # Determine delimiter based on first line
                 if '\t' in first_line:
                     delimiter = '\t'
@@ -179,29 +253,66 @@ class DataTransformer:
                     delimiter = ','
                 else:
                     delimiter = '\t'  # default to tab
-                
-                # Read the file
-                df = pd.read_csv(file_path, delimiter=delimiter, dtype=str)
-                
-                # Add source file information
-                df['source_file'] = file_path.name
-                
-                dataframes.append(df)
-                self.logger.debug(f"Successfully read {len(df)} rows from {file_path.name}")
-                
-            except Exception as e:
-                self.logger.error(f"Error reading file {file_path}: {str(e)}")
-                continue
-        
-        if not dataframes:
-            self.logger.warning("No data files could be read successfully")
+            
+            # Read the file (a pyarrow Table, or a DataFrame from the pandas fallback)
+            data = self._read_csv_file(file_path, delimiter, first_line.split(delimiter))
+            
+            # Add source file information
+            if isinstance(data, pd.DataFrame):
+                data['source_file'] = file_path.name
+            else:
+                data = data.append_column(
+                    'source_file', pa.array([file_path.name] * data.num_rows, pa.string())
+                )
+            
+            self.logger.debug(f"Successfully read {len(data)} rows from {file_path.name}")
+            return data
+            
+        except Exception as e:
+            self.logger.error(f"Error reading file {file_path}: {str(e)}")
             return None
+    
+    def _read_csv_file(self, file_path: Path, delimiter: str, columns: List[str]) -> Union[pd.DataFrame, 'pa.Table']:
+        """
+        Read one delimited file with every column as text.
         
-        # Combine all dataframes
-        combined_df = pd.concat(dataframes, ignore_index=True)
-        self.logger.info(f"Combined {len(dataframes)} files into {len(combined_df)} total rows")
+        Uses pyarrow's multithreaded CSV reader when it is installed, forcing
+        all columns to strings so values match pd.read_csv(dtype=str). Falls
+        back to pandas when pyarrow is missing or cannot parse the file.
         
-        return combined_df
+        Args:
+            file_path: Path to the data file
+            delimiter: Field delimiter
+            columns: Column names from the header line
+            
+        Returns:
+            pyarrow Table of string columns, or a DataFrame from the pandas fallback
+        """
+        if PYARROW_AVAILABLE and len(set(columns)) == len(columns):
+            try:
+                table = pa_csv.read_csv(
+                    file_path,
+                    parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=dict.fromkeys(columns, pa.string()),
+                        strings_can_be_null=True,
+                        null_values=_NA_VALUES
+                    )
+                )
+                # Any non-string column means the header did not match what pyarrow parsed
+                if all(pa.types.is_string(field.type) for field in table.schema):
+                    return table
+            except pa.ArrowInvalid as e:
+                self.logger.debug(f"pyarrow could not parse {file_path.name}, using pandas: {e}")
+        
+        return pd.read_csv(file_path, delimiter=delimiter, dtype=str)
+    
+    def _table_to_frame(self, table: 'pa.Table') -> pd.DataFrame:
+        """
+        Convert a pyarrow Table of strings to pandas, with NaN for missing
+        values as pd.read_csv(dtype=str) would produce.
+        """
+        return table.to_pandas().fillna(np.nan)
     
     def process_settlements(self) -> Optional[pd.DataFrame]:
         """
@@ -229,6 +340,8 @@ class DataTransformer:
         # Apply settlement-specific transformations
         processed_data = self._apply_settlement_transformations(processed_data)
         
+        self._write_checkpoint(processed_data, 'settlements')
+        
         self.logger.info(f"Settlement processing completed: {len(processed_data)} records")
         return processed_data
     
@@ -258,6 +371,8 @@ class DataTransformer:
         # Apply invoice-specific transformations
         processed_data = self._apply_invoice_transformations(processed_data)
         
+        self._write_checkpoint(processed_data, 'invoices')
+        
         self.logger.info(f"Invoice processing completed: {len(processed_data)} records")
         return processed_data
     
@@ -287,9 +402,52 @@ class DataTransformer:
         # Apply payment-specific transformations
         processed_data = self._apply_payment_transformations(processed_data)
         
+        self._write_checkpoint(processed_data, 'payments')
+        
         self.logger.info(f"Payment processing completed: {len(processed_data)} records")
         return processed_data
     
+    def _write_checkpoint(self, df: pd.DataFrame, name: str) -> None:
+        """
+        Write a processed dataset to <outputs>/checkpoints/<name>.parquet when
+        options.use_parquet_checkpoints is enabled. A failed checkpoint is
+        logged and never stops the run.
+        
+        Args:
+            df: Processed DataFrame
+            name: Dataset name (settlements, invoices or payments)
+        """
+        if not self.use_checkpoints:
+            return
+        if not PYARROW_AVAILABLE:
+            self.logger.warning("use_parquet_checkpoints is enabled but pyarrow is not installed")
+            return
+        
+        try:
+            self.checkpoint_path.mkdir(parents=True, exist_ok=True)
+            checkpoint_file = self.checkpoint_path / f"{name}.parquet"
+            df.to_parquet(checkpoint_file, engine='pyarrow', compression='snappy', index=False)
+            self.logger.debug(f"Checkpoint written: {checkpoint_file}")
+        except Exception as e:
+            self.logger.warning(f"Could not write {name} checkpoint: {str(e)}")
+    
+    def load_checkpoint(self, name: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        Load a processed dataset written by a previous run, e.g. to resume
+        after a failed export without re-reading the raw files.
+        
+        Args:
+            name: Dataset name (settlements, invoices or payments)
+            columns: Optional subset of columns to read
+            
+        Returns:
+            DataFrame or None if no checkpoint exists
+        """
+        checkpoint_file = self.checkpoint_path / f"{name}.parquet"
+        if not checkpoint_file.exists():
+            return None
+        return pd.read_parquet(checkpoint_file, engine='pyarrow', columns=columns)
+    
     def _apply_settlement_transformations(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Apply settlement-specific business logic transformations.
@@ -306,19 +464,21 @@ class DataTransformer:
             
         self.logger.info("Applying SettlementSummary_Base transformations...")
         self.logger.debug(f"Available columns: {list(df.columns)}")
-        transformed_df = df.copy()
+        # Columns are added or replaced, never written in place, so a shallow copy is enough
+        transformed_df = df.copy(deep=False)
         
         # Step 1: Add row_id index (like M Code line 35)
-        transformed_df = transformed_df.reset_index(drop=True)
-        transformed_df['row_id'] = transformed_df.index + 1
+        transformed_df['row_id'] = np.arange(1, len(transformed_df) + 1, dtype=np.int64)
         
         # Step 1.5: Add line_count field (original line count before any journal splits)
         transformed_df['line_count'] = 1
         
+        # Step 1.75: Parse posted_date once; the lookup key and journal sort reuse it
+        if 'posted_date' in transformed_df.columns:
+            transformed_df['posted_date'] = pd.to_datetime(transformed_df['posted_date'], errors='coerce', utc=True)
+        
         # Step 2: Add item_price_lookup key (like M Code lines 37-54)
-        transformed_df['item_price_lookup'] = transformed_df.apply(
-            self._create_item_price_lookup, axis=1
-        )
+        transformed_df['item_price_lookup'] = self._create_item_price_lookup(transformed_df)
         
         # Step 3: Convert financial columns using the M Code asNum logic
         financial_columns = [
@@ -330,29 +490,53 @@ class DataTransformer:
         
         for col in financial_columns:
             if col in transformed_df.columns:
-                transformed_df[col] = transformed_df[col].apply(self._parse_amount)
+                transformed_df[col] = self._parse_amount_series(transformed_df[col])
         
         # Step 4: Calculate MinRowID for each settlement_id (like M Code lines 163-171)
         if 'settlement_id' in transformed_df.columns:
-            min_row_lookup = transformed_df.groupby('settlement_id')['row_id'].min().to_dict()
-            transformed_df['MinRowID'] = transformed_df['settlement_id'].map(min_row_lookup)
+            transformed_df['MinRowID'] = transformed_df.groupby('settlement_id')['row_id'].transform('min')
         else:
             self.logger.warning("settlement_id column not found, using row_id as MinRowID")
             transformed_df['MinRowID'] = transformed_df['row_id']
         
         # Step 5: Calculate transaction_amount (like M Code lines 178-190)
-        transformed_df['transaction_amount'] = transformed_df.apply(
-            self._calculate_transaction_amount, axis=1
-        )
+        # Sum of all fee components
+        fee_columns = [
+            col for col in [
+                'price_amount', 'shipment_fee_amount', 'order_fee_amount',
+                'item_related_fee_amount', 'misc_fee_amount', 'other_fee_amount',
+                'direct_payment_amount', 'other_amount', 'promotion_amount'
+            ]
+            if col in transformed_df.columns
+        ]
+        normal_sum = transformed_df[fee_columns].to_numpy(dtype='float64').sum(axis=1)
+        
+        # Add total_amount adjustment only for first row of each settlement
+        if 'total_amount' in transformed_df.columns:
+            is_first_row = transformed_df['row_id'].to_numpy() == transformed_df['MinRowID'].to_numpy()
+            total_amount_adj = np.where(is_first_row, transformed_df['total_amount'].to_numpy(dtype='float64'), 0.0)
+        else:
+            total_amount_adj = 0.0
+        
+        transformed_df['transaction_amount'] = normal_sum - total_amount_adj
         
         # Step 6: Add tax_amount (like M Code lines 193-198)
-        transformed_df['tax_amount'] = transformed_df.apply(
-            self._calculate_tax_amount, axis=1
-        )
+        other_fee_reason = self._text_column(transformed_df, 'other_fee_reason_description').str.lower()
+        if 'other_fee_amount' in transformed_df.columns:
+            transformed_df['tax_amount'] = np.where(
+                other_fee_reason.eq('taxamount'), transformed_df['other_fee_amount'], 0.0
+            )
+        else:
+            transformed_df['tax_amount'] = 0.0
         
         # Step 7: Generate price lookup data (PriceLookup_CasePrice logic)
         self.price_lookup_data = self._create_price_lookup_table(transformed_df)
         
+        # Step 8: Store low-cardinality text columns as categoricals
+        for col in _CATEGORY_COLUMNS:
+            if col in transformed_df.columns:
+                transformed_df[col] = transformed_df[col].astype('category')
+        
         self.logger.info(f"Settlement transformations completed: {len(transformed_df)} rows processed")
         return transformed_df
     
@@ -372,8 +556,29 @@ class DataTransformer:
         self.logger.info("Creating price lookup table...")
         
         # Step 1: Add price_amount_line (M Code lines 13-32)
-        lookup_df = df.copy()
-        lookup_df['price_amount_line'] = lookup_df.apply(self._calculate_price_amount_line, axis=1)
+        price_type = self._text_column(df, 'price_type').str.lower()
+        txn_type = self._text_column(df, 'transaction_type').str.upper()
+        original_qty = pd.to_numeric(df['quantity_purchased'], errors='coerce').fillna(0).to_numpy()
+        price_amount_line = np.zeros(len(df))
+        
+        # SCENARIO 1: Damages/Reversals where quantity is present
+        damage_mask = (
+            txn_type.isin(['WAREHOUSE DAMAGE', 'REVERSAL_REIMBURSEMENT']).to_numpy(dtype=bool)
+            & (original_qty > 0)
+        )
+        if 'other_amount' in df.columns:
+            price_amount_line[damage_mask] = df['other_amount'].to_numpy(dtype='float64')[damage_mask]
+        
+        # SCENARIO 2: Principal sale price
+        principal_mask = ~damage_mask & price_type.eq('principal').to_numpy(dtype=bool)
+        if 'price_amount' in df.columns:
+            price_amount_line[principal_mask] = df['price_amount'].to_numpy(dtype='float64')[principal_mask]
+        
+        # SCENARIO 3: None of the above stays 0.0
+        # Only the columns the lookup needs are carried forward, not a full copy
+        lookup_df = df[['item_price_lookup', 'quantity_purchased']].assign(
+            price_amount_line=price_amount_line
+        )
         
         # Step 2: Filter valid lookup rows (M Code lines 34-37)
         filtered_df = lookup_df[
@@ -416,134 +621,86 @@ class DataTransformer:
             self.logger.warning("No valid price lookup data found")
             return pd.DataFrame(columns=['item_price_lookup', 'total_price_amount', 'quantity_purchased', 'case_price_amount'])
     
-    def _calculate_price_amount_line(self, row: pd.Series) -> float:
+    def _text_column(self, df: pd.DataFrame, column: str) -> pd.Series:
         """
-        Calculate price_amount_line based on M Code logic (lines 13-32).
+        Return a column as stripped text, matching str() on each value.
+        Missing values become 'nan' and a missing column becomes ''.
         """
-        price_type = str(row.get('price_type', '')).lower().strip()
-        txn_type = str(row.get('transaction_type', '')).upper().strip()
-        original_qty = row.get('quantity_purchased', 0)
-        
-        # SCENARIO 1: Damages/Reversals where quantity is present
-        if (txn_type in ['WAREHOUSE DAMAGE', 'REVERSAL_REIMBURSEMENT']) and original_qty > 0:
-            return row.get('other_amount', 0)
-        
-        # SCENARIO 2: Principal sale price
-        elif price_type == 'principal':
-            return row.get('price_amount', 0)
-        
-        # SCENARIO 3: None of the above
-        else:
-            return 0.0
+        if column not in df.columns:
+            return pd.Series('', index=df.index, dtype='string')
+        return df[column].astype('string').fillna('nan').str.strip()
     
-    def _create_item_price_lookup(self, row: pd.Series) -> str:
+    def _create_item_price_lookup(self, df: pd.DataFrame) -> pd.Series:
         """
-        Create item_price_lookup key based on M Code logic.
+        Create item_price_lookup keys based on M Code logic.
         Create lookup keys for ALL rows that have the necessary data (order_id, sku, etc.)
         so that invoice rows can match to their corresponding principal pricing rows.
         """
-        order_id = str(row.get('order_id', '')).strip()
-        sku = str(row.get('sku', '')).strip()
-        settlement_id = str(row.get('settlement_id', '')).strip()
-        transaction_type = str(row.get('transaction_type', '')).strip().lower()
+        order_id = self._text_column(df, 'order_id')
+        sku = self._text_column(df, 'sku')
+        settlement_id = self._text_column(df, 'settlement_id')
+        transaction_type = self._text_column(df, 'transaction_type').str.lower()
         
         # Skip rows that don't have enough data to create a meaningful lookup key
-        if not sku or sku.lower() in ['', 'nan', 'null']:
-            return ''
+        has_sku = ~sku.str.lower().isin(['', 'nan', 'null'])
         
-        # Parse posted_date to ddMMyyyy format
-        try:
-            posted_date = pd.to_datetime(row.get('posted_date'), errors='coerce')
-            if pd.isna(posted_date):
-                posted_date_str = '01011900'
-            else:
-                posted_date_str = posted_date.strftime('%d%m%Y')
-        except:
-            posted_date_str = '01011900'
+        # Format posted_date (parsed in Step 1.75) as ddMMyyyy
+        if 'posted_date' in df.columns:
+            posted_date_str = df['posted_date'].dt.strftime('%d%m%Y').fillna('01011900')
+        else:
+            posted_date_str = pd.Series('01011900', index=df.index, dtype='string')
         
         # Apply M Code conditional logic - same for all rows
-        if order_id == '' or pd.isna(order_id) or order_id.lower() == 'nan':
-            return f"{settlement_id}{posted_date_str}{transaction_type}"
-        else:
-            # Take last 7 characters of order_id + sku
-            order_suffix = order_id[-7:] if len(order_id) >= 7 else order_id
-            return f"{order_suffix}{sku}"
+        no_order = order_id.eq('') | order_id.str.lower().eq('nan')
+        settlement_key = settlement_id + posted_date_str.astype('string') + transaction_type
+        # Take last 7 characters of order_id + sku
+        order_key = order_id.str.slice(-7) + sku
+        
+        lookup = np.where(no_order, settlement_key, order_key)
+        return pd.Series(np.where(has_sku, lookup, ''), index=df.index)
     
-    def _parse_amount(self, value) -> float:
+    def _parse_amount_series(self, values: pd.Series) -> pd.Series:
         """
         Parse amount values using M Code asNum logic.
-        Handles various formats: "$1,234.56", "(123.45)", "1.234,56", etc.
+        Handles formats such as "$1,234.56" and "(123.45)"; blanks and
+        unparseable values become 0.0.
         """
-        if pd.isna(value) or value == "" or str(value).strip() == "":
-            return 0.0
+        if pd.api.types.is_numeric_dtype(values):
+            return values.astype('float64').fillna(0.0)
         
-        if isinstance(value, (int, float)):
-            return float(value)
+        # Most settlement amounts are plain decimals: convert those directly and
+        # only run the text cleanup on the values that did not parse
+        amounts = pd.to_numeric(values, errors='coerce').astype('float64')
+        dirty = amounts.isna() & values.notna()
+        if dirty.any():
+            amounts[dirty] = self._parse_formatted_amounts(values[dirty])
         
-        try:
-            # Convert to string and clean
-            text = str(value).strip()
-            
-            # Remove commas
-            text = text.replace(',', '')
-            
-            # Handle parentheses (negative numbers)
-            if text.startswith('(') and text.endswith(')'):
-                text = '-' + text[1:-1]
-            
-            # Remove currency symbols
-            text = text.replace('$', '').replace('€', '').replace('£', '')
-            
-            # Try parsing as US format first, then German format
-            try:
-                return float(text)
-            except ValueError:
-                # Try German format (1.234,56 -> 1234.56)
-                if '.' in text and ',' in text:
-                    # Assume German format: thousands separator = ., decimal = ,
-                    text = text.replace('.', '').replace(',', '.')
-                elif ',' in text and text.count(',') == 1:
-                    # Single comma might be decimal separator
-                    text = text.replace(',', '.')
-                return float(text)
-                
-        except (ValueError, TypeError):
-            self.logger.warning(f"Failed to parse amount: {value}")
-            return 0.0
+        return amounts.fillna(0.0)
     
-    def _calculate_transaction_amount(self, row: pd.Series) -> float:
+    def _parse_formatted_amounts(self, values: pd.Series) -> pd.Series:
         """
-        Calculate transaction_amount using M Code logic (lines 178-190).
+        Parse amount text with thousands separators, parenthesised negatives
+        or currency symbols. Blank or unparseable values become NaN.
         """
-        # Sum of all fee components
-        normal_sum = (
-            row.get('price_amount', 0) +
-            row.get('shipment_fee_amount', 0) +
-            row.get('order_fee_amount', 0) +
-            row.get('item_related_fee_amount', 0) +
-            row.get('misc_fee_amount', 0) +
-            row.get('other_fee_amount', 0) +
-            row.get('direct_payment_amount', 0) +
-            row.get('other_amount', 0) +
-            row.get('promotion_amount', 0)
-        )
+        # Convert to string, trim and remove thousands separators
+        text = values.astype('string').str.strip().str.replace(',', '', regex=False)
         
-        # Add total_amount adjustment only for first row of each settlement
-        is_first_row = row.get('row_id') == row.get('MinRowID')
-        total_amount_adj = -row.get('total_amount', 0) if is_first_row else 0
+        # Handle parentheses (negative numbers)
+        negative = text.str.startswith('(') & text.str.endswith(')')
+        text = text.mask(negative, '-' + text.str.slice(1, -1))
         
-        return normal_sum + total_amount_adj
-    
-    def _calculate_tax_amount(self, row: pd.Series) -> float:
-        """
-        Calculate tax_amount using M Code logic (lines 193-198).
-        """
-        other_fee_reason = str(row.get('other_fee_reason_description', '')).lower().strip()
+        # Remove currency symbols
+        text = text.str.replace(_CURRENCY_RE, '', regex=True)
         
-        if other_fee_reason == 'taxamount':
-            return row.get('other_fee_amount', 0)
-        else:
-            return 0.0
+        amounts = pd.to_numeric(text, errors='coerce').astype('float64')
+        
+        failed = amounts.isna() & text.notna() & text.ne('')
+        if failed.any():
+            self.logger.warning(
+                f"Failed to parse {int(failed.sum())} amount(s), e.g. {values[failed].iloc[0]!r}"
+            )
+        
+        return amounts
     
     def _apply_invoice_transformations(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -558,7 +715,7 @@ class DataTransformer:
         if df.empty:
             return df
             
-        transformed_df = df.copy()
+        transformed_df = df.copy(deep=False)
         
         # Apply invoice-specific logic here
         # This is a placeholder for actual business logic
@@ -579,7 +736,7 @@ class DataTransformer:
         if df.empty:
             return df
             
-        transformed_df = df.copy()
+        transformed_df = df.copy(deep=False)
         
         # Apply payment-specific logic here
         # This is a placeholder for actual business logic
@@ -619,7 +776,7 @@ class DataTransformer:
         if invoices is not None and not invoices.empty:
             if not base_data.empty and 'order_id' in base_data.columns and 'order_id' in invoices.columns:
                 base_data = base_data.merge(
-                    invoices, 
+                    self._merge_columns(invoices), 
                     on='order_id', 
                     how='outer', 
                     suffixes=('_settlement', '_invoice')
@@ -633,7 +790,7 @@ class DataTransformer:
         if payments is not None and not payments.empty:
             if not base_data.empty and 'order_id' in base_data.columns and 'order_id' in payments.columns:
                 base_data = base_data.merge(
-                    payments, 
+                    self._merge_columns(payments), 
                     on='order_id', 
                     how='outer', 
                     suffixes=('', '_payment')
@@ -659,6 +816,19 @@ class DataTransformer:
         
         return final_data
     
+    def _merge_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Trim an invoice or payment frame to the columns an export can use
+        before it is merged, so the join does not carry unused columns.
+        
+        Args:
+            df: Processed invoices or payments DataFrame
+            
+        Returns:
+            Projection of df with order_id and the journal export columns
+        """
+        return df.loc[:, df.columns.intersection(self.JOURNAL_COLUMNS, sort=False)]
+    
     def _prepare_journal_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Prepare data specifically for the Journal Export.
@@ -672,26 +842,13 @@ class DataTransformer:
         if df.empty:
             return df
             
-        journal_df = df.copy()
-        
-        # Select and rename columns for journal export (include all M Code calculated fields)
-        journal_columns = [
-            'settlement_id', 'order_id', 'merchant_order_id', 'transaction_type', 
-            'posted_date', 'deposit_date', 'total_amount', 'currency',
-            'transaction_amount', 'tax_amount', 'row_id', 'item_price_lookup',
-            'shipment_fee_type', 'order_fee_type', 'item_related_fee_type',
-            'other_fee_reason_description', 'promotion_type', 'price_type',
-            'marketplace_name', 'sku', 'quantity_purchased', 'price_amount',
-            'data_source', 'source_file'
-        ]
-        
-        # Keep only columns that exist
-        available_columns = [col for col in journal_columns if col in journal_df.columns]
-        journal_df = journal_df[available_columns]
+        # Keep only columns that exist; the projection is already a new frame
+        available_columns = [col for col in self.JOURNAL_COLUMNS if col in df.columns]
+        journal_df = df.loc[:, available_columns]
         
-        # Sort by date if available
+        # Sort by date if available (datetime64 after settlement transformations)
         if 'posted_date' in journal_df.columns:
-            journal_df = journal_df.sort_values('posted_date')
+            journal_df = journal_df.sort_values('posted_date', kind='stable')
         
         return journal_df
     
@@ -706,13 +863,13 @@ class DataTransformer:
             df: Combined DataFrame (SettlementSummary)
             
         Returns:
-            DataFrame formatted for invoice export (all settlement data)
+            DataFrame formatted for invoice export (all settlement data, not copied)
         """
         if df.empty:
             return df
             
         # InvoiceExport.m uses SettlementSummary data, so return settlement data
-        invoice_df = df[df['data_source'] == 'settlements'].copy() if 'data_source' in df.columns else df.copy()
+        invoice_df = self._settlement_rows(df)
         
         return invoice_df
     
@@ -727,12 +884,39 @@ class DataTransformer:
             df: Combined DataFrame (SettlementSummary)
             
         Returns:
-            DataFrame formatted for payment export (all settlement data)
+            DataFrame formatted for payment export (all settlement data, not copied)
         """
         if df.empty:
             return df
             
         # PaymentExport.m uses SettlementSummary data, so return settlement data
-        payment_df = df[df['data_source'] == 'settlements'].copy() if 'data_source' in df.columns else df.copy()
+        payment_df = self._settlement_rows(df)
+        
+        return payment_df
+    
+    def _settlement_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Select the rows that came from settlement files.
+        
+        When data_source is categorical the comparison runs on the integer
+        codes rather than broadcasting the string across every row.
+        
+        Args:
+            df: Combined DataFrame
+            
+        Returns:
+            Settlement rows (or df itself when there is no data_source column)
+        """
+        if 'data_source' not in df.columns:
+            return df
+        
+        source = df['data_source']
+        if isinstance(source.dtype, pd.CategoricalDtype):
+            categories = source.cat.categories
+            if 'settlements' not in categories:
+                return df.iloc[0:0]
+            mask = source.cat.codes.to_numpy() == categories.get_loc('settlements')
+        else:
+            mask = (source == 'settlements').to_numpy()
         
-        return payment_df
\ No newline at end of file
+        return df.loc[mask]
@@ -6,26 +6,213 @@ Usage:
   python scripts/update_tracking_manual.py --csv manual_tracking_updates.csv
   OR
   python scripts/update_tracking_manual.py --settlement 23874397121 --invoice AMZN6751437 --zoho-id 73985000000191046
+  OR
+  python scripts/update_tracking_manual.py --export-csv
+
+Updates are stored in zoho_tracking.parquet and mirrored to zoho_tracking.csv
+(which the other scripts read). Use --no-csv to skip the CSV rewrite during a
+batch of updates, then --export-csv once at the end. If another script changes
+zoho_tracking.csv before the export, the tool stops instead of dropping either
+set of changes (--export-csv --force keeps the Parquet copy).
 """
 
 import argparse
+import codecs
 import csv
+import json
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
-def update_from_csv(csv_file: Path):
-    """Update tracking from CSV file with columns: settlement_id, record_type, local_identifier, zoho_id"""
-    from paths import get_zoho_tracking_path
+
+# Column types of zoho_tracking.csv. Ids stay text (no int inference, no lost
+# leading zeros); the low-cardinality columns are categoricals while updating.
+TRACKING_DTYPES = {
+    'settlement_id': 'string',
+    'record_type': 'category',
+    'local_identifier': 'string',
+    'zoho_id': 'string',
+    'zoho_number': 'string',
+    'reference_number': 'string',
+    'status': 'category',
+    'created_date': 'string'
+}
+
+# Parquet schema metadata recording which zoho_tracking.csv the Parquet copy
+# matches (size/mtime) and whether it holds updates not yet exported to it
+_SYNC_METADATA_KEY = b'zoho_tracking_sync'
+
+# Categories always present, so e.g. 'POSTED' can be assigned to any file
+_CATEGORY_VALUES = {
+    'record_type': ['INVOICE', 'PAYMENT', 'JOURNAL'],
+    'status': ['PENDING', 'POSTED', 'FAILED'],
+}
+
+
+def _apply_tracking_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast tracking columns to TRACKING_DTYPES.
+    
+    Categories are the known values plus whatever the file holds, so no
+    existing value (other scripts write statuses like MATCHED) is lost.
+    """
+    dtypes = {}
+    for col, dtype in TRACKING_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'category':
+            observed = df[col].astype(str).unique().tolist()
+            dtype = pd.CategoricalDtype(list(dict.fromkeys(_CATEGORY_VALUES[col] + observed)))
+        dtypes[col] = dtype
+    return df.astype(dtypes)
+
+
+def _read_tracking_csv(csv_file: Path) -> pd.DataFrame:
+    """
+    Read a tracking CSV with explicit column types and empty cells kept as ''.
+    
+    Uses pyarrow's multithreaded CSV reader when it is installed, falling
+    back to pd.read_csv(dtype=TRACKING_DTYPES, keep_default_na=False).
+    """
+    if PYARROW_AVAILABLE:
+        with open(csv_file, newline='', encoding='utf-8-sig') as f:
+            columns = next(csv.reader(f), [])
+        if columns and len(set(columns)) == len(columns):
+            try:
+                # String columns are never null by default, like keep_default_na=False
+                table = pa_csv.read_csv(csv_file, convert_options=pa_csv.ConvertOptions(
+                    column_types=dict.fromkeys(columns, pa.string())
+                ))
+                return _apply_tracking_dtypes(table.to_pandas())
+            except pa.ArrowInvalid:
+                pass
+    return _apply_tracking_dtypes(pd.read_csv(csv_file, dtype=TRACKING_DTYPES, keep_default_na=False))
+
+
+def _csv_signature(csv_file: Path):
+    """[size, mtime_ns] of the tracking CSV, or None when it doesn't exist"""
+    try:
+        stat = csv_file.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _parquet_sync_state(parquet_file: Path) -> dict:
+    """Sync metadata saved with the Parquet copy ({} for files written without it)"""
+    raw = (pq.read_schema(parquet_file).metadata or {}).get(_SYNC_METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def load_tracking(force: bool = False):
+    """
+    Load the tracking table typed per TRACKING_DTYPES.
+    
+    Reads the Parquet copy while zoho_tracking.csv is unchanged since it was
+    saved (other scripts only update the CSV), otherwise parses the CSV.
+    
+    Args:
+        force: Read the Parquet copy's unexported updates even though the CSV
+            has changed since
+    
+    Returns:
+        DataFrame, or None when no tracking file exists
+    
+    Raises:
+        RuntimeError: If the Parquet copy has unexported updates and the CSV
+            was changed by another script since (unless force is set)
+    """
+    from paths import get_zoho_tracking_path, get_zoho_tracking_parquet_path
+    csv_file = get_zoho_tracking_path()
+    parquet_file = get_zoho_tracking_parquet_path()
+    
+    if PYARROW_AVAILABLE and parquet_file.exists():
+        state = _parquet_sync_state(parquet_file)
+        csv_unchanged = 'csv' in state and state['csv'] == _csv_signature(csv_file)
+        if csv_unchanged or (force and state.get('pending_export')):
+            return _apply_tracking_dtypes(pd.read_parquet(parquet_file).fillna(''))
+        if state.get('pending_export'):
+            raise RuntimeError(
+                f"{parquet_file} has updates that were not exported, and {csv_file} was changed "
+                f"since. Run --export-csv --force to overwrite the CSV with the Parquet copy, or "
+                f"delete {parquet_file} to continue from the CSV (re-apply the unexported updates)."
+            )
+    if csv_file.exists():
+        return _read_tracking_csv(csv_file)
+    return None
+
+
+def save_tracking(df: pd.DataFrame, write_csv: bool = True):
+    """
+    Save the tracking table to (by default) zoho_tracking.csv and Parquet.
+    
+    The CSV is written first; the Parquet copy then records the CSV's
+    size/mtime, so load_tracking() can tell whether the CSV changed since.
+    
+    Args:
+        df: Tracking DataFrame
+        write_csv: Also rewrite the CSV read by the other scripts
+    """
+    from paths import get_zoho_tracking_path, get_zoho_tracking_parquet_path
     tracking_file = get_zoho_tracking_path()
     
-    if not tracking_file.exists():
-        print(f"[ERROR] Tracking file not found: {tracking_file}")
+    table = None
+    if PYARROW_AVAILABLE:
+        # All-string schema keeps the Parquet file stable between runs (even for empty columns)
+        schema = pa.schema([(col, pa.string()) for col in df.columns])
+        table = pa.Table.from_pandas(df.astype(object), schema=schema, preserve_index=False)
+    if write_csv or table is None:
+        if table is not None:
+            # pyarrow's C++ writer; the BOM matches what to_csv(encoding='utf-8-sig') wrote
+            with open(tracking_file, 'wb') as f:
+                f.write(codecs.BOM_UTF8)
+                pa_csv.write_csv(table, f)
+        else:
+            df.to_csv(tracking_file, index=False, encoding='utf-8-sig')
+        print(f"Tracking file saved: {tracking_file}")
+    if table is not None:
+        sync_state = {'csv': _csv_signature(tracking_file), 'pending_export': not write_csv}
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            _SYNC_METADATA_KEY: json.dumps(sync_state)
+        })
+        pq.write_table(table, get_zoho_tracking_parquet_path(), compression='zstd')
+        if not write_csv:
+            print(f"Tracking store saved: {get_zoho_tracking_parquet_path()} (run --export-csv to refresh the CSV)")
+
+
+def export_csv(force: bool = False):
+    """
+    Write the current tracking table to zoho_tracking.csv
+    
+    Args:
+        force: Export the Parquet copy's updates even if the CSV was changed
+            by another script since (those changes are overwritten)
+    """
+    df_tracking = load_tracking(force)
+    if df_tracking is None:
+        print("[ERROR] No tracking file found")
         return
+    save_tracking(df_tracking)
+
+
+def update_from_csv(csv_file: Path, write_csv: bool = True):
+    """Update tracking from CSV file with columns: settlement_id, record_type, local_identifier, zoho_id"""
+    # Load tracking file (as text, so ids keep their exact form and zoho_id can hold strings)
+    df_tracking = load_tracking()
     
-    # Load tracking file
-    df_tracking = pd.read_csv(tracking_file)
+    if df_tracking is None:
+        print("[ERROR] Tracking file not found")
+        return
     
     # Load updates
     df_updates = pd.read_csv(csv_file)
@@ -35,59 +222,56 @@ def update_from_csv(csv_file: Path):
         print(f"[ERROR] CSV must have columns: {', '.join(required_cols)}")
         return
     
-    updated_count = 0
-    new_count = 0
-    
-    for idx, update in df_updates.iterrows():
-        settlement_id = str(update['settlement_id'])
-        record_type = str(update['record_type']).upper()
-        local_identifier = str(update['local_identifier'])
-        zoho_id = str(update['zoho_id'])
-        
-        # Find matching record
-        mask = (
-            (df_tracking['settlement_id'] == settlement_id) &
-            (df_tracking['record_type'] == record_type) &
-            (df_tracking['local_identifier'] == local_identifier)
+    key_cols = ['settlement_id', 'record_type', 'local_identifier']
+    
+    # Normalize update keys the same way for every row; the last update for a key wins
+    updates = pd.DataFrame({
+        'settlement_id': df_updates['settlement_id'].astype(str),
+        'record_type': df_updates['record_type'].astype(str).str.upper(),
+        'local_identifier': df_updates['local_identifier'].astype(str),
+        'zoho_id': df_updates['zoho_id'].astype(str)
+    }).drop_duplicates(subset=key_cols, keep='last')
+    
+    tracking_keys = pd.MultiIndex.from_frame(df_tracking[key_cols].astype(str))
+    update_keys = pd.MultiIndex.from_frame(updates[key_cols])
+    
+    # Update existing records in one positional assignment per column
+    matched = np.flatnonzero(tracking_keys.isin(update_keys))
+    if len(matched):
+        zoho_ids = pd.Series(updates['zoho_id'].to_numpy(), index=update_keys)
+        df_tracking.iloc[matched, df_tracking.columns.get_loc('zoho_id')] = \
+            zoho_ids.reindex(tracking_keys[matched]).to_numpy()
+        df_tracking.iloc[matched, df_tracking.columns.get_loc('status')] = 'POSTED'
+    
+    # Add new records with a single concat
+    is_new = ~update_keys.isin(tracking_keys)
+    updated_count = int((~is_new).sum())
+    new_count = int(is_new.sum())
+    
+    if new_count:
+        new_records = updates[is_new]
+        new_records = new_records.assign(
+            zoho_number=new_records['local_identifier'].where(new_records['record_type'] == 'INVOICE', ''),
+            reference_number=new_records['settlement_id'],
+            status='POSTED',
+            created_date=datetime.now().isoformat()
         )
-        
-        if mask.any():
-            # Update existing
-            df_tracking.loc[mask, 'zoho_id'] = zoho_id
-            df_tracking.loc[mask, 'status'] = 'POSTED'
-            updated_count += 1
-        else:
-            # Add new record
-            new_record = {
-                'settlement_id': settlement_id,
-                'record_type': record_type,
-                'local_identifier': local_identifier,
-                'zoho_id': zoho_id,
-                'zoho_number': local_identifier if record_type == 'INVOICE' else '',
-                'reference_number': settlement_id,
-                'status': 'POSTED',
-                'created_date': datetime.now().isoformat()
-            }
-            df_tracking = pd.concat([df_tracking, pd.DataFrame([new_record])], ignore_index=True)
-            new_count += 1
+        df_tracking = pd.concat([df_tracking, new_records.reindex(columns=df_tracking.columns)], ignore_index=True)
     
     # Save
-    df_tracking.to_csv(tracking_file, index=False, encoding='utf-8-sig')
     print(f"[SUCCESS] Updated {updated_count} records, added {new_count} new records")
-    print(f"Tracking file saved: {tracking_file}")
+    save_tracking(df_tracking, write_csv)
 
 
-def update_single(settlement_id: str, record_type: str, local_identifier: str, zoho_id: str):
+def update_single(settlement_id: str, record_type: str, local_identifier: str, zoho_id: str,
+                  write_csv: bool = True):
     """Update a single tracking record"""
-    from paths import get_zoho_tracking_path
-    tracking_file = get_zoho_tracking_path()
+    df = load_tracking()
     
-    if not tracking_file.exists():
-        print(f"[ERROR] Tracking file not found: {tracking_file}")
+    if df is None:
+        print("[ERROR] Tracking file not found")
         return
     
-    df = pd.read_csv(tracking_file)
-    
     record_type = record_type.upper()
     
     # Find matching record
@@ -96,10 +280,11 @@ def update_single(settlement_id: str, record_type: str, local_identifier: str, z
         (df['record_type'] == record_type) &
         (df['local_identifier'] == local_identifier)
     )
+    idx = np.flatnonzero(mask.to_numpy(dtype=bool, na_value=False))
     
-    if mask.any():
-        df.loc[mask, 'zoho_id'] = zoho_id
-        df.loc[mask, 'status'] = 'POSTED'
+    if len(idx):
+        df.iloc[idx, df.columns.get_loc('zoho_id')] = zoho_id
+        df.iloc[idx, df.columns.get_loc('status')] = 'POSTED'
         print(f"[SUCCESS] Updated tracking for {record_type} {local_identifier}")
     else:
         # Add new record
@@ -113,11 +298,10 @@ def update_single(settlement_id: str, record_type: str, local_identifier: str, z
             'status': 'POSTED',
             'created_date': datetime.now().isoformat()
         }
-        df = pd.concat([df, pd.DataFrame([new_record])], ignore_index=True)
+        df = pd.concat([df, pd.DataFrame([new_record], columns=df.columns)], ignore_index=True)
         print(f"[SUCCESS] Added new tracking record for {record_type} {local_identifier}")
     
-    df.to_csv(tracking_file, index=False, encoding='utf-8-sig')
-    print(f"Tracking file saved: {tracking_file}")
+    save_tracking(df, write_csv)
 
 
 def main():
@@ -126,21 +310,29 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--csv', help='CSV file with tracking updates (columns: settlement_id, record_type, local_identifier, zoho_id)')
     group.add_argument('--single', action='store_true', help='Update single record')
+    group.add_argument('--export-csv', action='store_true', help='Write the Parquet tracking store out to zoho_tracking.csv')
     
     parser.add_argument('--settlement', help='Settlement ID (for --single)')
     parser.add_argument('--type', choices=['INVOICE', 'PAYMENT', 'JOURNAL'], help='Record type (for --single)')
     parser.add_argument('--identifier', help='Local identifier (invoice number, payment ref, etc.) (for --single)')
     parser.add_argument('--zoho-id', help='Zoho transaction ID (for --single)')
+    parser.add_argument('--no-csv', action='store_true', help='Only update the Parquet store (run --export-csv afterwards)')
+    parser.add_argument('--force', action='store_true', help='With --export-csv: overwrite a CSV changed since the --no-csv updates')
     
     args = parser.parse_args()
     
-    if args.csv:
-        update_from_csv(Path(args.csv))
-    elif args.single:
-        if not all([args.settlement, args.type, args.identifier, args.zoho_id]):
-            print("[ERROR] --settlement, --type, --identifier, and --zoho-id are required for --single")
-            return
-        update_single(args.settlement, args.type, args.identifier, args.zoho_id)
+    try:
+        if args.csv:
+            update_from_csv(Path(args.csv), write_csv=not args.no_csv)
+        elif args.single:
+            if not all([args.settlement, args.type, args.identifier, args.zoho_id]):
+                print("[ERROR] --settlement, --type, --identifier, and --zoho-id are required for --single")
+                return
+            update_single(args.settlement, args.type, args.identifier, args.zoho_id, write_csv=not args.no_csv)
+        elif args.export_csv:
+            export_csv(args.force)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
 
 
 if __name__ == '__main__':
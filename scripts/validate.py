@@ -15,6 +15,7 @@ Author: ETL Pipeline
 Date: October 2025
 """
 
+import csv
 import logging
 import sys
 from pathlib import Path
@@ -25,6 +26,14 @@ from datetime import datetime
 import unittest
 
 
+# ISO-8601 date with optional time and UTC offset, e.g. '2025-06-05T22:07:18+00:00'
+_ISO_DATE_PATTERN = (
+    r'\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])'
+    r'(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?'
+    r'(?:\s*(?:Z|UTC|[+-]\d{2}:?\d{2}))?'
+)
+
+
 class DataValidator:
     """
     Class for performing data quality checks and validation.
@@ -50,6 +59,11 @@ class DataValidator:
         self.validation_rules = config.get('processing', {}).get('validation', {})
         self.business_rules = config.get('business_rules', {})
         
+        # Rule columns used by every business rule check
+        self.primary_key = self.business_rules.get('merge_keys', {}).get('primary', 'order_id')
+        self.amount_columns = tuple(self.business_rules.get('amount_columns', ()))
+        self.date_columns = tuple(self.business_rules.get('date_columns', ()))
+        
         self.logger.info("DataValidator initialized")
     
     def validate_data_completeness(self, df: pd.DataFrame, data_type: str) -> Dict[str, Any]:
@@ -64,6 +78,15 @@ class DataValidator:
             Dictionary with validation results
         """
         if df.empty:
+            return self._completeness_result(None, 0, data_type)
+        
+        # Calculate missing values per column (one reduction over the whole frame)
+        return self._completeness_result(df.isna().sum(), len(df), data_type)
+    
+    def _completeness_result(self, na_counts: Optional[pd.Series], total_rows: int,
+                             data_type: str) -> Dict[str, Any]:
+        """Build the completeness result from per-column missing counts."""
+        if not total_rows:
             return {
                 'status': 'EMPTY',
                 'message': f'{data_type} dataset is empty',
@@ -71,21 +94,13 @@ class DataValidator:
                 'completeness_score': 0.0
             }
         
-        # Calculate missing values per column
-        missing_data = {}
-        total_cells = len(df) * len(df.columns)
-        total_missing = 0
-        
-        for column in df.columns:
-            missing_count = df[column].isna().sum()
-            missing_percentage = (missing_count / len(df)) * 100
-            
-            missing_data[column] = {
-                'count': int(missing_count),
-                'percentage': round(missing_percentage, 2)
-            }
-            
-            total_missing += missing_count
+        percentages = (na_counts / total_rows * 100).round(2)
+        missing_data = {
+            column: {'count': int(count), 'percentage': float(percentage)}
+            for column, count, percentage in zip(na_counts.index, na_counts.to_numpy(), percentages.to_numpy())
+        }
+        total_cells = total_rows * len(na_counts)
+        total_missing = int(na_counts.sum())
         
         completeness_score = ((total_cells - total_missing) / total_cells) * 100
         
@@ -94,76 +109,160 @@ class DataValidator:
             'message': f'{data_type} data completeness: {completeness_score:.1f}%',
             'missing_data': missing_data,
             'completeness_score': round(completeness_score, 2),
-            'total_rows': len(df),
-            'total_columns': len(df.columns)
+            'total_rows': total_rows,
+            'total_columns': len(na_counts)
         }
     
-    def validate_business_rules(self, df: pd.DataFrame, data_type: str) -> Dict[str, Any]:
+    def validate_business_rules(self, df: pd.DataFrame, data_type: str,
+                                return_samples: bool = False,
+                                na_counts: Optional[pd.Series] = None) -> Dict[str, Any]:
         """
         Validate business rules and constraints.
         
         Args:
             df: DataFrame to validate
             data_type: Type of data being validated
+            return_samples: Include example duplicate key values in violations
+            na_counts: Per-column missing counts of df if already computed
+                (e.g. for the completeness check), reused instead of recounting
             
         Returns:
             Dictionary with validation results
         """
-        violations = []
-        
         if df.empty:
-            return {
-                'status': 'SKIPPED',
-                'message': 'No data to validate',
-                'violations': violations
-            }
+            return self._business_rules_result(None, data_type)
         
         # Check required key fields
-        merge_keys = self.business_rules.get('merge_keys', {})
-        primary_key = merge_keys.get('primary', 'order_id')
+        primary_key = self.primary_key
+        columns = set(df.columns)
+        
+        dup_count = 0
+        samples = None
+        if primary_key in columns:
+            # Check for duplicate keys (count only; rows are sliced out just for samples)
+            if return_samples:
+                duplicate_mask = df[primary_key].duplicated()
+                dup_count = int(duplicate_mask.sum())
+                if dup_count > 0:
+                    samples = df.loc[duplicate_mask, primary_key].head(10).tolist()
+            else:
+                dup_count = self._count_duplicate_keys(df[primary_key])
+        
+        # Validate amount columns (coerced as one block)
+        invalid_amounts = {}
+        amount_columns = [col for col in self.amount_columns if col in columns]
+        if amount_columns:
+            invalid_amounts = self._invalid_amount_counts(df[amount_columns], na_counts)
+        
+        # Validate date columns
+        invalid_dates = {}
+        for col in self.date_columns:
+            if col in columns:
+                # Check for invalid date values
+                invalid_dates[col] = self._invalid_date_count(df[col])
+        
+        violations = self._rule_violations(primary_key, dup_count, invalid_amounts, invalid_dates)
+        if samples is not None:
+            violations[0]['samples'] = samples
+        
+        return self._business_rules_result(violations, data_type)
+    
+    def _count_duplicate_keys(self, keys: pd.Series) -> int:
+        """
+        Count key values that repeat an earlier one.
+        
+        Numeric keys are counted with a sort (np.unique) over the raw array;
+        text keys use duplicated(). Text is not cast to integers, since that
+        would make e.g. '0012' and '12' collide.
+        """
+        values = keys.to_numpy()
+        if values.dtype.kind in 'iuf':
+            _, counts = np.unique(values, return_counts=True)
+            return int((counts - 1).sum())
+        return int(keys.duplicated().sum())
+    
+    def _invalid_amount_counts(self, amounts: pd.DataFrame,
+                               na_counts: Optional[pd.Series] = None) -> Dict[str, int]:
+        """
+        Count values per amount column that fail numeric coercion.
+        
+        Columns that already have a numeric dtype cannot hold invalid values,
+        so only the text columns are coerced (as one block).
+        """
+        counts = dict.fromkeys(amounts.columns, 0)
+        numeric_columns = set(amounts.select_dtypes(include='number').columns)
+        text_columns = [col for col in amounts.columns if col not in numeric_columns]
+        
+        if text_columns:
+            text = amounts[text_columns]
+            coerced = text.apply(pd.to_numeric, errors='coerce')
+            missing = na_counts[text_columns] if na_counts is not None else text.isna().sum()
+            counts.update((coerced.isna().sum() - missing).astype(int).to_dict())
+        
+        return counts
+    
+    def _invalid_date_count(self, values: pd.Series) -> int:
+        """
+        Count non-missing values in a date column that do not parse as dates.
         
-        if primary_key in df.columns:
-            # Check for duplicate keys
-            duplicates = df[df[primary_key].duplicated()]
-            if not duplicates.empty:
+        ISO-8601 strings (what the settlement files contain) are picked out by a
+        regex and parsed with the fixed ISO format, which still rejects impossible
+        dates and times (e.g. '2025-02-30'). Everything else, including ISO-shaped
+        values that fail that parse, goes through pd.to_datetime's inference.
+        """
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return 0
+        
+        present = values.dropna()
+        is_iso = present.astype(str).str.fullmatch(_ISO_DATE_PATTERN).to_numpy(dtype=bool)
+        iso = present[is_iso]
+        parsed = pd.to_datetime(iso.astype(str), format='ISO8601', errors='coerce', utc=True)
+        others = pd.concat([present[~is_iso], iso[parsed.isna().to_numpy()]])
+        if others.empty:
+            return 0
+        return int(pd.to_datetime(others, errors='coerce').isna().sum())
+    
+    def _rule_violations(self, primary_key: str, dup_count: int,
+                         invalid_amounts: Dict[str, int], invalid_dates: Dict[str, int]) -> List[Dict[str, Any]]:
+        """Turn duplicate and invalid-value counts into violation records."""
+        violations = []
+        
+        if dup_count > 0:
+            violations.append({
+                'rule': 'Unique Primary Key',
+                'field': primary_key,
+                'count': dup_count,
+                'message': f'Found {dup_count} duplicate {primary_key} values'
+            })
+        
+        for col, invalid_count in invalid_amounts.items():
+            if invalid_count > 0:
                 violations.append({
-                    'rule': 'Unique Primary Key',
-                    'field': primary_key,
-                    'count': len(duplicates),
-                    'message': f'Found {len(duplicates)} duplicate {primary_key} values'
+                    'rule': 'Valid Numeric Amount',
+                    'field': col,
+                    'count': int(invalid_count),
+                    'message': f'Found {invalid_count} invalid numeric values in {col}'
                 })
         
-        # Validate amount columns
-        amount_columns = self.business_rules.get('amount_columns', [])
-        for col in amount_columns:
-            if col in df.columns:
-                # Check for invalid numeric values
-                numeric_col = pd.to_numeric(df[col], errors='coerce')
-                invalid_count = numeric_col.isna().sum() - df[col].isna().sum()
-                
-                if invalid_count > 0:
-                    violations.append({
-                        'rule': 'Valid Numeric Amount',
-                        'field': col,
-                        'count': invalid_count,
-                        'message': f'Found {invalid_count} invalid numeric values in {col}'
-                    })
+        for col, invalid_count in invalid_dates.items():
+            if invalid_count > 0:
+                violations.append({
+                    'rule': 'Valid Date Format',
+                    'field': col,
+                    'count': int(invalid_count),
+                    'message': f'Found {invalid_count} invalid date values in {col}'
+                })
         
-        # Validate date columns
-        date_columns = self.business_rules.get('date_columns', [])
-        for col in date_columns:
-            if col in df.columns:
-                # Check for invalid date values
-                date_col = pd.to_datetime(df[col], errors='coerce')
-                invalid_count = date_col.isna().sum() - df[col].isna().sum()
-                
-                if invalid_count > 0:
-                    violations.append({
-                        'rule': 'Valid Date Format',
-                        'field': col,
-                        'count': invalid_count,
-                        'message': f'Found {invalid_count} invalid date values in {col}'
-                    })
+        return violations
+    
+    def _business_rules_result(self, violations: Optional[List[Dict[str, Any]]], data_type: str) -> Dict[str, Any]:
+        """Build the business rule result (violations is None when there was no data)."""
+        if violations is None:
+            return {
+                'status': 'SKIPPED',
+                'message': 'No data to validate',
+                'violations': []
+            }
         
         status = 'PASSED' if not violations else 'FAILED'
         
@@ -185,10 +284,16 @@ class DataValidator:
         Returns:
             Dictionary with comprehensive validation results
         """
-        # Perform individual validations
-        completeness_result = self.validate_data_completeness(df, data_type)
-        business_rules_result = self.validate_business_rules(df, data_type)
+        # Perform individual validations, sharing one missing-value pass
+        na_counts = df.isna().sum() if not df.empty else None
+        completeness_result = self._completeness_result(na_counts, len(df), data_type)
+        business_rules_result = self.validate_business_rules(df, data_type, na_counts=na_counts)
         
+        return self._quality_result(completeness_result, business_rules_result, data_type)
+    
+    def _quality_result(self, completeness_result: Dict[str, Any], business_rules_result: Dict[str, Any],
+                        data_type: str) -> Dict[str, Any]:
+        """Combine completeness and business rule results into the overall score."""
         # Calculate overall quality score
         completeness_weight = 0.4
         business_rules_weight = 0.6
@@ -219,6 +324,12 @@ class DataValidator:
         }
 
 
+def slow(test_method):
+    """Mark a test as slow so run_unit_tests leaves it out of the quick suite."""
+    test_method.slow = True
+    return test_method
+
+
 class ETLTestSuite(unittest.TestCase):
     """
     Unit test suite for the ETL pipeline components.
@@ -247,23 +358,31 @@ class ETLTestSuite(unittest.TestCase):
                 'log_level': 'DEBUG'
             }
         }
-    
-    def test_column_normalization(self):
-        """Test column name normalization function."""
-        # Import here to avoid circular imports during module initialization
-        from transform import DataTransformer
         
-        transformer = DataTransformer(self.test_config)
+        # Shared fixtures, built once. The transformer methods under test
+        # return new frames and leave their input unmodified.
+        # (Import here to avoid circular imports during module initialization)
+        from transform import DataTransformer
+        cls.transformer = DataTransformer(cls.test_config)
         
-        # Create test DataFrame with messy column names
-        test_df = pd.DataFrame({
+        # Test DataFrame with messy column names
+        cls.messy_columns_df = pd.DataFrame({
             'Settlement ID ': [1, 2, 3],
             'Order-Fee Amount': [10.50, 20.00, 15.75],
             '  Posted Date  ': ['2025-01-01', '2025-01-02', '2025-01-03']
         })
         
+        # Test DataFrame with messy data
+        cls.dirty_df = pd.DataFrame({
+            'amount': ['10.50 ', ' 20.00', '15.75'],
+            'description': ['  Test  ', 'Another Test ', '  '],
+            'invalid_num': ['abc', '123', 'nan']
+        })
+    
+    def test_column_normalization(self):
+        """Test column name normalization function."""
         # Normalize columns
-        normalized_df = transformer.normalize_column_names(test_df)
+        normalized_df = self.transformer.normalize_column_names(self.messy_columns_df)
         
         # Check results
         expected_columns = ['settlement_id', 'order_fee_amount', 'posted_date']
@@ -271,19 +390,8 @@ class ETLTestSuite(unittest.TestCase):
     
     def test_data_cleaning(self):
         """Test data value cleaning function."""
-        from transform import DataTransformer
-        
-        transformer = DataTransformer(self.test_config)
-        
-        # Create test DataFrame with messy data
-        test_df = pd.DataFrame({
-            'amount': ['10.50 ', ' 20.00', '15.75'],
-            'description': ['  Test  ', 'Another Test ', '  '],
-            'invalid_num': ['abc', '123', 'nan']
-        })
-        
         # Clean data
-        cleaned_df = transformer.clean_data_values(test_df)
+        cleaned_df = self.transformer.clean_data_values(self.dirty_df)
         
         # Check that whitespace is trimmed
         self.assertEqual(cleaned_df['amount'].iloc[0], '10.50')
@@ -291,16 +399,26 @@ class ETLTestSuite(unittest.TestCase):
     
     def test_empty_data_handling(self):
         """Test handling of empty DataFrames."""
-        from transform import DataTransformer
-        
-        transformer = DataTransformer(self.test_config)
-        
         # Test with empty DataFrame
         empty_df = pd.DataFrame()
-        result = transformer.normalize_column_names(empty_df)
+        result = self.transformer.normalize_column_names(empty_df)
         
         self.assertTrue(result.empty)
     
+    def test_invalid_date_detection(self):
+        """Test that impossible ISO dates and times count as invalid dates."""
+        validator = DataValidator({})
+        dates = pd.Series([
+            '2025-06-05T22:07:18+00:00',
+            '2025-06-05',
+            '2025-02-30',
+            '2025-13-01',
+            '2025-01-01T99:00:00',
+            None
+        ])
+        
+        self.assertEqual(validator._invalid_date_count(dates), 3)
+    
     def test_config_validation(self):
         """Test configuration validation."""
         # Test with valid config
@@ -393,45 +511,46 @@ def generate_validation_report(validation_results: Dict[str, Any], output_path:
         True if report generated successfully
     """
     try:
-        report_data = []
-        
-        # Add summary information
-        summary = validation_results.get('summary', {})
-        report_data.append({
-            'Category': 'SUMMARY',
-            'Dataset': 'All',
-            'Status': summary.get('overall_status', 'UNKNOWN'),
-            'Score': '',
-            'Details': f"Passed: {summary.get('passed_datasets', 0)}, "
-                      f"Failed: {summary.get('failed_datasets', 0)}"
-        })
+        report_file = output_path / "Data_Validation_Report.csv"
         
-        # Add dataset-specific information
-        for dataset_name, result in validation_results.get('datasets', {}).items():
-            report_data.append({
-                'Category': 'DATASET',
-                'Dataset': dataset_name,
-                'Status': result.get('overall_status', 'UNKNOWN'),
-                'Score': result.get('overall_score', ''),
-                'Details': f"Completeness: {result.get('completeness', {}).get('completeness_score', 0)}%, "
-                          f"Violations: {result.get('business_rules', {}).get('total_violations', 0)}"
+        # Rows are streamed straight to the file; nothing else reads the report in-process
+        with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['Category', 'Dataset', 'Status', 'Score', 'Details'],
+                                    lineterminator='\n')
+            writer.writeheader()
+            
+            # Add summary information
+            summary = validation_results.get('summary', {})
+            writer.writerow({
+                'Category': 'SUMMARY',
+                'Dataset': 'All',
+                'Status': summary.get('overall_status', 'UNKNOWN'),
+                'Score': '',
+                'Details': f"Passed: {summary.get('passed_datasets', 0)}, "
+                          f"Failed: {summary.get('failed_datasets', 0)}"
             })
             
-            # Add violation details if any
-            violations = result.get('business_rules', {}).get('violations', [])
-            for violation in violations:
-                report_data.append({
-                    'Category': 'VIOLATION',
+            # Add dataset-specific information
+            for dataset_name, result in validation_results.get('datasets', {}).items():
+                writer.writerow({
+                    'Category': 'DATASET',
                     'Dataset': dataset_name,
-                    'Status': violation.get('rule', 'Unknown Rule'),
-                    'Score': violation.get('count', ''),
-                    'Details': violation.get('message', '')
+                    'Status': result.get('overall_status', 'UNKNOWN'),
+                    'Score': result.get('overall_score', ''),
+                    'Details': f"Completeness: {result.get('completeness', {}).get('completeness_score', 0)}%, "
+                              f"Violations: {result.get('business_rules', {}).get('total_violations', 0)}"
                 })
-        
-        # Create DataFrame and save report
-        report_df = pd.DataFrame(report_data)
-        report_file = output_path / "Data_Validation_Report.csv"
-        report_df.to_csv(report_file, index=False, encoding='utf-8-sig')
+                
+                # Add violation details if any
+                violations = result.get('business_rules', {}).get('violations', [])
+                for violation in violations:
+                    writer.writerow({
+                        'Category': 'VIOLATION',
+                        'Dataset': dataset_name,
+                        'Status': violation.get('rule', 'Unknown Rule'),
+                        'Score': violation.get('count', ''),
+                        'Details': violation.get('message', '')
+                    })
         
         logging.getLogger(__name__).info(f"Validation report saved: {report_file}")
         return True
@@ -441,6 +560,12 @@ def generate_validation_report(validation_results: Dict[str, Any], output_path:
         return False
 
 
+def _fast_test_names() -> List[str]:
+    """Names of the ETLTestSuite tests not marked @slow."""
+    names = unittest.TestLoader().getTestCaseNames(ETLTestSuite)
+    return [name for name in names if not getattr(getattr(ETLTestSuite, name), 'slow', False)]
+
+
 def run_unit_tests() -> bool:
     """
     Run the unit test suite.
@@ -452,8 +577,8 @@ def run_unit_tests() -> bool:
     logger.info("Running unit tests...")
     
     try:
-        # Create test suite
-        suite = unittest.TestLoader().loadTestsFromTestCase(ETLTestSuite)
+        # Create test suite (TestSuite still runs ETLTestSuite.setUpClass)
+        suite = unittest.TestSuite(ETLTestSuite(name) for name in _fast_test_names())
         
         # Run tests
         runner = unittest.TextTestRunner(verbosity=2)
@@ -4,31 +4,149 @@ Settlement Validation & Pre-Flight Checks
 Validates settlements before Zoho sync and identifies issues requiring user intervention
 """
 
-import pandas as pd
-import yaml
+from __future__ import annotations
+
+import csv
+import importlib.util
+import json
+import re
+import sys
 from pathlib import Path
-from typing import Dict, List, Tuple
-from zoho_sync import ZohoBooks
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 import logging
 
+# pandas, pyarrow, yaml and zoho_sync (requests) are imported inside the
+# functions that need them, so importing this module stays cheap.
+if TYPE_CHECKING:
+    import pandas as pd
+
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Amazon order ID as written into journal notes
+_ORDER_ID_RE = re.compile(r'Order ID: (\d+-\d+-\d+)')
+
+# Columns the validation checks read from each output file
+JOURNAL_COLUMNS = ['GL_Account', 'Debit', 'Credit', 'Notes']
+INVOICE_COLUMNS = ['SKU', 'Invoice Line Amount', 'amount', 'rate']
+PAYMENT_COLUMNS = ['Payment Amount']
+
+# Settlement history signature from the last run that found nothing pending
+HISTORY_SYNC_MARKER = Path("outputs") / ".cache" / "history_sync.json"
+
+# Amount columns parsed straight to float64 (unparseable values become NaN)
+AMOUNT_COLUMNS = ['Debit', 'Credit', 'Invoice Line Amount', 'amount', 'rate', 'Payment Amount']
+
+# Strings pandas' read_csv treats as missing, so the pyarrow reader agrees with it
+_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+
+def _read_marker(marker_file: Path) -> Optional[Dict]:
+    """Contents of a JSON marker file, or None if missing or unreadable"""
+    try:
+        with open(marker_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_marker(marker_file: Path, data: Dict):
+    """Write a JSON marker file (failures are only logged)"""
+    try:
+        marker_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(marker_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    except OSError as e:
+        logger.warning(f"Could not write {marker_file}: {e}")
+
+
+def read_csv_header(path: Path) -> List[str]:
+    """Column names from a CSV's first line (BOM stripped), without parsing the rest"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+
+def read_csv_columns(path: Path, columns: Optional[List[str]] = None,
+                     numeric: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a CSV, keeping only the given columns that the file actually has.
+    
+    Uses pyarrow's multithreaded CSV reader (types inferred, pandas' missing
+    value strings) when it is installed, falling back to pd.read_csv(usecols=...).
+    
+    Args:
+        path: CSV file
+        columns: Columns to keep (None for all); absent ones are skipped
+        numeric: Columns to return as float64, parsed as such by pyarrow;
+            values that are not numbers become NaN
+        
+    Returns:
+        DataFrame with the selected columns in file order
+    """
+    import pandas as pd
+    
+    header = read_csv_header(path)
+    if columns is not None:
+        columns = [col for col in header if col in columns] or None
+    numeric = [col for col in (numeric or []) if col in (columns or header)]
+    
+    df = None
+    if PYARROW_AVAILABLE and header and len(set(header)) == len(header):
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+        try:
+            table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+                include_columns=columns or [],
+                column_types=dict.fromkeys(numeric, pa.float64()),
+                strings_can_be_null=True,
+                null_values=_NA_VALUES
+            ))
+            df = table.to_pandas()
+        except pa.ArrowInvalid as e:
+            logger.debug(f"pyarrow could not parse {path.name}, using pandas: {e}")
+    if df is None:
+        df = pd.read_csv(path, usecols=columns)
+    
+    # Only the pandas fallback (or a column pyarrow could not type) needs converting
+    for col in numeric:
+        if df[col].dtype != 'float64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
 
 class SettlementValidator:
     """Comprehensive validation for settlements before Zoho posting"""
     
+    # Most recently read output files kept parsed (a settlement reads up to 3)
+    CSV_CACHE_SIZE = 16
+    
     def __init__(self):
+        from zoho_sync import ZohoBooks
+        
         self.config_dir = Path("config")
         self.output_dir = Path("outputs")
         self.load_config()
         self.sku_mapping = self._load_sku_mapping()
+        # (path, columns) -> (mtime, DataFrame); callers must not modify the cached frames
+        self._csv_cache: Dict[Tuple[Path, Optional[Tuple[str, ...]]], Tuple[float, pd.DataFrame]] = {}
+        # Zoho SKU lookups persisted between runs (entries expire after ZohoBooks.ITEM_CACHE_TTL_SECONDS)
+        self.sku_cache_file = self.output_dir / ".cache" / "zoho_skus.json"
+        ZohoBooks.load_item_cache(self.sku_cache_file)
         
     def load_config(self):
         """Load GL mapping and credentials"""
+        import yaml
+        
         with open(self.config_dir / "zoho_gl_mapping.yaml") as f:
             config = yaml.safe_load(f)
             self.gl_mapping = config.get('gl_account_mapping', {})
+        # Only membership is checked during validation
+        self.gl_mapping_keys = frozenset(self.gl_mapping)
     
     def validate_settlement(self, settlement_id: str) -> Dict:
         """
@@ -70,9 +188,10 @@ class SettlementValidator:
             result['can_proceed'] = False
             return result
         
-        # 2. Validate journal balance
+        # 2. Validate journal balance (the journal is parsed once and shared by every check)
         journal_file = settlement_dir / f"Journal_{settlement_id}.csv"
-        result['journal_balance'] = self.validate_journal_balance(journal_file)
+        journal_df = self._read_csv(journal_file, JOURNAL_COLUMNS)
+        result['journal_balance'] = self.validate_journal_balance(journal_df)
         
         if not result['journal_balance']['balanced']:
             result['errors'].append(
@@ -84,7 +203,7 @@ class SettlementValidator:
             result['can_proceed'] = False  # STOP - requires user override
         
         # 3. Check for unmapped GL accounts
-        result['missing_gl_accounts'] = self.check_gl_mapping(journal_file)
+        result['missing_gl_accounts'] = self.check_gl_mapping(journal_df)
         
         if result['missing_gl_accounts']:
             result['errors'].append(
@@ -96,7 +215,7 @@ class SettlementValidator:
         # 4. Check for SKUs (if invoice exists)
         if result['file_status']['invoice']:
             invoice_file = settlement_dir / f"Invoice_{settlement_id}.csv"
-            result['missing_skus'] = self.check_skus(invoice_file)
+            result['missing_skus'] = self.check_skus(self._read_csv(invoice_file, INVOICE_COLUMNS))
             
             if result['missing_skus']:
                 result['warnings'].append(
@@ -109,31 +228,26 @@ class SettlementValidator:
             clearing_total = 0.0
             invoices_total = 0.0
             payments_total = 0.0
-            # Clearing debit from journal
-            journal_file = settlement_dir / f"Journal_{settlement_id}.csv"
-            if journal_file.exists():
-                jdf = pd.read_csv(journal_file)
-                jdf['Debit'] = pd.to_numeric(jdf.get('Debit', 0), errors='coerce').fillna(0)
-                jdf['Credit'] = pd.to_numeric(jdf.get('Credit', 0), errors='coerce').fillna(0)
-                mask = jdf.get('GL_Account', '').astype(str) == 'Amazon.ca Clearing'
-                clearing_total = float(jdf.loc[mask, 'Debit'].sum() - jdf.loc[mask, 'Credit'].sum())
+            # Clearing debit from the shared journal frame (amounts are float64 from the read)
+            clearing = (journal_df['GL_Account'] == 'Amazon.ca Clearing').to_numpy(dtype=bool, na_value=False)
+            clearing_total = float(journal_df['Debit'][clearing].sum() - journal_df['Credit'][clearing].sum())
             # Invoices total
             inv_file = settlement_dir / f"Invoice_{settlement_id}.csv"
             if inv_file.exists():
-                idf = pd.read_csv(inv_file)
+                idf = self._read_csv(inv_file, INVOICE_COLUMNS)
                 amt_col = None
                 for c in ['Invoice Line Amount', 'amount', 'rate']:
                     if c in idf.columns:
                         amt_col = c; break
                 if amt_col:
-                    invoices_total = float(pd.to_numeric(idf[amt_col], errors='coerce').fillna(0).sum())
+                    invoices_total = float(idf[amt_col].sum())
             # Payments total
             pay_file = settlement_dir / f"Payment_{settlement_id}.csv"
             if pay_file.exists():
-                pdf = pd.read_csv(pay_file)
+                pdf = self._read_csv(pay_file, PAYMENT_COLUMNS)
                 pcol = 'Payment Amount' if 'Payment Amount' in pdf.columns else None
                 if pcol:
-                    payments_total = float(pd.to_numeric(pdf[pcol], errors='coerce').fillna(0).sum())
+                    payments_total = float(pdf[pcol].sum())
             # Compare with small tolerance
             tol = 0.01
             if abs(clearing_total - invoices_total) > tol:
@@ -171,11 +285,42 @@ class SettlementValidator:
         for account in result.get('missing_gl_accounts', []):
             rows.append({'Type': 'ERROR', 'Message': f"Unmapped GL account: {account}"})
 
-        df = pd.DataFrame(rows if rows else [{'Type': 'INFO', 'Message': 'No issues detected'}])
-        df.to_csv(report_file, index=False, encoding='utf-8-sig')
+        # A handful of rows; written directly (same layout as DataFrame.to_csv)
+        with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['Type', 'Message'], lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows if rows else [{'Type': 'INFO', 'Message': 'No issues detected'}])
         logger.info(f"Validation report saved: {report_file}")
         return report_file
     
+    def _read_csv(self, path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Read an output CSV, reusing the parsed frame while the file is unchanged.
+        
+        Only `columns` are parsed when given, with AMOUNT_COLUMNS read as float64
+        (see read_csv_columns). Entries are
+        keyed by path and column selection and checked against the file's
+        mtime; the least recently used entry is dropped beyond CSV_CACHE_SIZE.
+        """
+        key = (path, tuple(columns) if columns is not None else None)
+        mtime = path.stat().st_mtime
+        cached = self._csv_cache.pop(key, None)
+        if cached is not None and cached[0] == mtime:
+            df = cached[1]
+        else:
+            df = read_csv_columns(path, columns, numeric=AMOUNT_COLUMNS)
+        
+        self._csv_cache[key] = (mtime, df)
+        if len(self._csv_cache) > self.CSV_CACHE_SIZE:
+            self._csv_cache.pop(next(iter(self._csv_cache)))
+        return df
+    
+    def _as_frame(self, data: Union[Path, pd.DataFrame]) -> pd.DataFrame:
+        """Accept either an already loaded frame or a CSV path."""
+        import pandas as pd
+        
+        return data if isinstance(data, pd.DataFrame) else self._read_csv(Path(data))
+    
     def check_files_exist(self, settlement_dir: Path) -> Dict[str, bool]:
         """Check which output files exist"""
         settlement_id = settlement_dir.name
@@ -185,9 +330,9 @@ class SettlementValidator:
             'payment': (settlement_dir / f"Payment_{settlement_id}.csv").exists()
         }
     
-    def validate_journal_balance(self, journal_file: Path) -> Dict:
+    def validate_journal_balance(self, journal: Union[Path, pd.DataFrame]) -> Dict:
         """Validate debits = credits"""
-        df = pd.read_csv(journal_file)
+        df = self._as_frame(journal)
         
         debits = df['Debit'].sum()
         credits = df['Credit'].sum()
@@ -202,43 +347,44 @@ class SettlementValidator:
             'line_count': len(df)
         }
     
-    def check_gl_mapping(self, journal_file: Path) -> List[str]:
+    def check_gl_mapping(self, journal: Union[Path, pd.DataFrame]) -> List[str]:
         """Check for GL accounts without Zoho mapping"""
-        df = pd.read_csv(journal_file)
-        
-        missing = []
-        for account in df['GL_Account'].unique():
-            if account not in self.gl_mapping:
-                missing.append(account)
+        df = self._as_frame(journal)
         
-        return missing
+        # Set lookups over the distinct accounts only (first-seen order kept)
+        return [account for account in df['GL_Account'].unique() if account not in self.gl_mapping_keys]
     
-    def check_skus(self, invoice_file: Path) -> List[str]:
+    def check_skus(self, invoice: Union[Path, pd.DataFrame]) -> List[str]:
         """Return SKUs that are not found in Zoho (after applying local mapping)."""
-        df = pd.read_csv(invoice_file)
+        from zoho_sync import ZohoBooks
+        
+        df = self._as_frame(invoice)
         if 'SKU' not in df.columns:
             return []
 
-        # Normalize and de-duplicate
-        skus = [str(s) for s in df['SKU'].dropna().unique().tolist()]
+        # Normalize (stripped, as the Zoho item cache is keyed) and de-duplicate
+        skus = {str(s).strip() for s in df['SKU'].dropna().unique()}
+        skus.discard('')
 
         # Apply local SKU mapping
-        mapped_skus = [self.sku_mapping.get(sku, sku) for sku in skus]
+        mapped_skus = {self.sku_mapping.get(sku, sku) for sku in skus}
 
-        # Check existence in Zoho (unique only)
+        # Check existence in Zoho (unique only, one batched lookup)
         zoho = ZohoBooks()
-        missing: List[str] = []
-        for sku in sorted(set(mapped_skus)):
-            try:
-                item_id = zoho.get_item_id(sku)
-                if not item_id:
-                    missing.append(sku)
-            except Exception as e:
-                logger.warning(f"SKU check failed for {sku}: {e}")
-        return missing
+        unique_skus = sorted(mapped_skus)
+        try:
+            item_ids = zoho.get_item_ids_bulk(unique_skus)
+        except Exception as e:
+            # Nothing could be verified: report every SKU as not found in Zoho
+            logger.warning(f"SKU check failed: {e}")
+            return unique_skus
+        ZohoBooks.save_item_cache(self.sku_cache_file)
+        return [sku for sku in unique_skus if sku not in item_ids]
 
     def _load_sku_mapping(self) -> Dict[str, str]:
         """Load SKU mapping from config; fall back to empty mapping on error."""
+        import yaml
+        
         mapping_file = self.config_dir / "sku_mapping.yaml"
         if not mapping_file.exists():
             return {}
@@ -246,7 +392,7 @@ class SettlementValidator:
             with open(mapping_file, 'r', encoding='utf-8') as f:
                 cfg = yaml.safe_load(f) or {}
                 mapping = cfg.get('sku_mapping', {}) or {}
-                return {str(k): str(v) for k, v in mapping.items()}
+                return {str(k).strip(): str(v).strip() for k, v in mapping.items()}
         except Exception as e:
             logger.warning(f"Failed to load SKU mapping from {mapping_file}: {e}")
             return {}
@@ -257,12 +403,22 @@ class SettlementValidator:
         
         # Check for duplicate order IDs
         journal_file = settlement_dir / f"Journal_{settlement_id}.csv"
-        if journal_file.exists():
-            df = pd.read_csv(journal_file)
-            if 'Notes' in df.columns:
-                # Extract order IDs from notes
-                order_ids = df['Notes'].str.extract(r'Order ID: (\d+-\d+-\d+)', expand=False).dropna()
-                duplicates = order_ids[order_ids.duplicated()].unique()
+        # The header alone decides whether there is anything to check
+        if journal_file.exists() and 'Notes' in read_csv_header(journal_file):
+            df = self._read_csv(journal_file, JOURNAL_COLUMNS)
+            if len(df) > 1:
+                # Extract order IDs from notes (one compiled-regex scan over the raw values)
+                notes = [note for note in df['Notes'].to_numpy(dtype=object) if isinstance(note, str)]
+                order_ids = [match[1] for match in map(_ORDER_ID_RE.search, notes) if match]
+                
+                duplicates = {}  # insertion-ordered, so IDs are listed in first-repeat order
+                if len(set(order_ids)) != len(order_ids):
+                    seen = set()
+                    for order_id in order_ids:
+                        if order_id in seen:
+                            duplicates[order_id] = None
+                        else:
+                            seen.add(order_id)
                 
                 if len(duplicates) > 0:
                     result['warnings'].append(f"Duplicate order IDs found: {', '.join(duplicates)}")
@@ -270,99 +426,116 @@ class SettlementValidator:
         return result
     
     def print_validation_report(self, result: Dict):
-        """Pretty print validation results"""
-        print("\n" + "="*70)
-        print(f"VALIDATION REPORT - Settlement {result['settlement_id']}")
-        print("="*70)
+        """Pretty print validation results (written to stdout in one call)"""
+        lines = []
+        lines.append("\n" + "="*70)
+        lines.append(f"VALIDATION REPORT - Settlement {result['settlement_id']}")
+        lines.append("="*70)
         
         # Overall status
         status_icon = "✅" if result['valid'] else "❌"
         proceed_icon = "🟢" if result['can_proceed'] else "🔴"
-        print(f"\n{status_icon} Valid: {result['valid']}")
-        print(f"{proceed_icon} Can Proceed: {result['can_proceed']}")
+        lines.append(f"\n{status_icon} Valid: {result['valid']}")
+        lines.append(f"{proceed_icon} Can Proceed: {result['can_proceed']}")
         
         # Journal balance
-        print(f"\n📊 JOURNAL BALANCE:")
+        lines.append(f"\n📊 JOURNAL BALANCE:")
         jb = result['journal_balance']
         if jb:
             balance_icon = "✅" if jb['balanced'] else "❌"
-            print(f"  {balance_icon} Debits:  ${jb['debits']:,.2f}")
-            print(f"  {balance_icon} Credits: ${jb['credits']:,.2f}")
+            lines.append(f"  {balance_icon} Debits:  ${jb['debits']:,.2f}")
+            lines.append(f"  {balance_icon} Credits: ${jb['credits']:,.2f}")
             if not jb['balanced']:
-                print(f"  ⚠️  Difference: ${jb['difference']:,.2f}")
-            print(f"  📝 Line Count: {jb['line_count']}")
+                lines.append(f"  ⚠️  Difference: ${jb['difference']:,.2f}")
+            lines.append(f"  📝 Line Count: {jb['line_count']}")
         
         # GL Accounts
         if result['missing_gl_accounts']:
-            print(f"\n❌ MISSING GL MAPPINGS:")
+            lines.append(f"\n❌ MISSING GL MAPPINGS:")
             for account in result['missing_gl_accounts']:
-                print(f"  - {account}")
+                lines.append(f"  - {account}")
         else:
-            print(f"\n✅ All GL accounts mapped")
+            lines.append(f"\n✅ All GL accounts mapped")
         
         # SKUs
         if result['missing_skus']:
-            print(f"\n⚠️  SKUs TO VERIFY IN ZOHO:")
+            lines.append(f"\n⚠️  SKUs TO VERIFY IN ZOHO:")
             for sku in result['missing_skus']:
-                print(f"  - {sku}")
+                lines.append(f"  - {sku}")
         
         # Files
-        print(f"\n📁 FILES:")
+        lines.append(f"\n📁 FILES:")
         for file_type, exists in result['file_status'].items():
             icon = "✅" if exists else "❌"
-            print(f"  {icon} {file_type.capitalize()}: {exists}")
+            lines.append(f"  {icon} {file_type.capitalize()}: {exists}")
         
         # Errors
         if result['errors']:
-            print(f"\n❌ ERRORS:")
+            lines.append(f"\n❌ ERRORS:")
             for error in result['errors']:
-                print(f"  - {error}")
+                lines.append(f"  - {error}")
         
         # Warnings
         if result['warnings']:
-            print(f"\n⚠️  WARNINGS:")
+            lines.append(f"\n⚠️  WARNINGS:")
             for warning in result['warnings']:
-                print(f"  - {warning}")
+                lines.append(f"  - {warning}")
         
-        print("\n" + "="*70)
+        lines.append("\n" + "="*70)
         
         # Action required
         if not result['can_proceed']:
-            print("🛑 ACTION REQUIRED - Cannot proceed until issues are resolved")
-            print("="*70)
+            lines.append("🛑 ACTION REQUIRED - Cannot proceed until issues are resolved")
+            lines.append("="*70)
         elif result['warnings']:
-            print("⚠️  REVIEW WARNINGS - Proceed with caution")
-            print("="*70)
+            lines.append("⚠️  REVIEW WARNINGS - Proceed with caution")
+            lines.append("="*70)
         else:
-            print("✅ READY TO SYNC - All validations passed")
-            print("="*70)
+            lines.append("✅ READY TO SYNC - All validations passed")
+            lines.append("="*70)
+        
+        sys.stdout.write('\n'.join(lines) + '\n')
         
         return result
 
 
 def validate_all_pending_settlements():
-    """Validate all settlements that haven't been synced to Zoho"""
+    """
+    Validate all settlements that haven't been synced to Zoho
+    
+    When a run finds nothing pending, the history file's size and mtime are
+    recorded in HISTORY_SYNC_MARKER; later runs skip reading the history
+    until the file changes.
+    """
     from paths import get_settlement_history_path
-    history = pd.read_csv(get_settlement_history_path())
-    pending = history[history['zoho_synced'] == False]
+    history_file = get_settlement_history_path()
+    stat = history_file.stat()
+    signature = {'path': str(history_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
     
-    validator = SettlementValidator()
     results = []
-    
-    for _, row in pending.iterrows():
-        settlement_id = row['settlement_id']
-        result = validator.validate_settlement(str(settlement_id))
-        validator.print_validation_report(result)
-        results.append(result)
+    if _read_marker(HISTORY_SYNC_MARKER) != signature:
+        history = read_csv_columns(history_file, ['settlement_id', 'zoho_synced'])
+        pending_ids = history.loc[history['zoho_synced'] == False, 'settlement_id']
+        
+        if pending_ids.empty:
+            _write_marker(HISTORY_SYNC_MARKER, signature)
+        else:
+            validator = SettlementValidator()
+            for settlement_id in pending_ids:
+                result = validator.validate_settlement(str(settlement_id))
+                validator.print_validation_report(result)
+                results.append(result)
     
     # Summary
     print("\n" + "="*70)
     print("SUMMARY")
     print("="*70)
     total = len(results)
-    ready = sum(1 for r in results if r['can_proceed'])
-    blocked = sum(1 for r in results if not r['can_proceed'])
-    warnings = sum(1 for r in results if r['warnings'])
+    ready = warnings = 0
+    for r in results:
+        ready += bool(r['can_proceed'])
+        warnings += bool(r['warnings'])
+    blocked = total - ready
     
     print(f"Total settlements: {total}")
     print(f"✅ Ready to sync: {ready}")
@@ -374,8 +547,6 @@ def validate_all_pending_settlements():
 
 
 if __name__ == "__main__":
-    import sys
-    
     if len(sys.argv) > 1:
         # Validate specific settlement
         settlement_id = sys.argv[1]
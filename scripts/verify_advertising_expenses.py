@@ -8,128 +8,207 @@ Usage:
 
 import pandas as pd
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Tuple
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 # Add scripts directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
 from paths import get_settlement_history_path
+from validate_settlement import read_csv_columns, read_csv_header
 from zoho_sync import ZohoBooks
 
+ADVERTISING_ACCOUNT = 'Amazon Advertising Expense'
+
+# Settlement -> posted journal ID lookups kept between runs (see ZohoBooks.load_journal_cache)
+JOURNAL_CACHE_FILE = Path("outputs") / ".cache" / "journal_ids.json"
+
+
+def journal_advertising(journal_file: Path) -> Tuple[float, int, int]:
+    """
+    Total the advertising expense lines of one journal file.
+    
+    With pyarrow, only GL_Account and the amount column are scanned, one
+    record batch at a time, and each batch is filtered and summed in Arrow
+    compute, so the full columns are never held in memory. The column types
+    are pinned rather than inferred from the first block; a file Arrow can't
+    convert (e.g. non-numeric amounts) is read by pandas instead, as it is
+    without pyarrow.
+    
+    Returns:
+        (advertising amount, advertising line count, journal line count)
+    """
+    # Sum debits (expenses are debits in journal, but credits when posted to Zoho)
+    amount_col = 'Debit' if 'Debit' in read_csv_header(journal_file) else 'Credit'
+    
+    if PYARROW_AVAILABLE:
+        csv_format = ds.CsvFileFormat(convert_options=pa_csv.ConvertOptions(
+            column_types={'GL_Account': pa.string(), amount_col: pa.float64()}
+        ))
+        try:
+            amount, line_count, journal_lines = 0, 0, 0
+            for batch in ds.dataset(journal_file, format=csv_format).to_batches(
+                    columns=['GL_Account', amount_col]):
+                journal_lines += batch.num_rows
+                mask = pc.equal(batch['GL_Account'], ADVERTISING_ACCOUNT)
+                matched = pc.sum(mask).as_py() or 0
+                if matched:
+                    line_count += matched
+                    amount += pc.sum(batch[amount_col].filter(mask)).as_py() or 0
+            return amount, line_count, journal_lines
+        except pa.ArrowInvalid:
+            pass
+    
+    df = read_csv_columns(journal_file, ['GL_Account', 'Debit', 'Credit'])
+    advertising_df = df[df['GL_Account'] == ADVERTISING_ACCOUNT]
+    if advertising_df.empty:
+        return 0, 0, len(df)
+    amount = advertising_df['Debit'].sum() if 'Debit' in advertising_df.columns else advertising_df['Credit'].sum()
+    return amount, len(advertising_df), len(df)
+
+
+def _analyze_one(journal_file: Path) -> Dict:
+    """Advertising totals for one settlement journal (error details on failure)."""
+    settlement_id = journal_file.parent.name
+    try:
+        settlement_advertising, line_count, journal_lines = journal_advertising(journal_file)
+        return {
+            'local_advertising': settlement_advertising,
+            'line_count': line_count,
+            'journal_lines': journal_lines,
+            'posted': False
+        }
+    except Exception as e:
+        print(f"  Error reading {settlement_id}: {e}")
+        return {
+            'local_advertising': 0,
+            'line_count': 0,
+            'journal_lines': 0,
+            'posted': False,
+            'error': str(e)
+        }
+
 
 def analyze_local_journals() -> Dict:
     """Analyze advertising expenses from local journal files."""
     output_dir = Path("outputs")
     results = {}
     
-    settlements = [d.name for d in output_dir.iterdir() if d.is_dir() and d.name.isdigit()]
+    # scandir reports the entry type from the directory listing (no stat per entry)
+    with os.scandir(output_dir) as entries:
+        settlements = [e.name for e in entries if e.name.isdigit() and e.is_dir()]
+    journal_files = [
+        output_dir / settlement_id / f"Journal_{settlement_id}.csv"
+        for settlement_id in sorted(settlements)
+    ]
+    journal_files = [f for f in journal_files if f.exists()]
     
-    total_advertising = 0
+    # Journals are independent; pyarrow and pandas release the GIL while parsing
+    if journal_files:
+        with ThreadPoolExecutor(max_workers=min(8, len(journal_files))) as executor:
+            for journal_file, data in zip(journal_files, executor.map(_analyze_one, journal_files)):
+                results[journal_file.parent.name] = data
     
-    for settlement_id in sorted(settlements):
-        journal_file = output_dir / settlement_id / f"Journal_{settlement_id}.csv"
-        
-        if not journal_file.exists():
-            continue
-        
-        try:
-            df = pd.read_csv(journal_file)
+    total_advertising = sum(data['local_advertising'] for data in results.values())
+    
+    return results, total_advertising
+
+
+def _zoho_journal_advertising(zoho: ZohoBooks, settlement_id: str, journal_id: str) -> Dict:
+    """Advertising totals of one posted Zoho journal."""
+    try:
+        # Get journal details
+        result = zoho._api_request('GET', f'journals/{journal_id}')
+        if result.get('code') == 0:
+            journal = result.get('journal', {})
+            line_items = journal.get('line_items', [])
             
             # Find advertising expense lines
-            advertising_mask = df['GL_Account'] == 'Amazon Advertising Expense'
+            advertising_total = 0
+            advertising_lines = []
             
-            if advertising_mask.any():
-                advertising_df = df[advertising_mask]
-                # Sum debits (expenses are debits in journal, but credits when posted to Zoho)
-                # Check both debit and credit columns
-                settlement_advertising = advertising_df['Debit'].sum() if 'Debit' in advertising_df.columns else advertising_df['Credit'].sum()
-                
-                results[settlement_id] = {
-                    'local_advertising': settlement_advertising,
-                    'line_count': len(advertising_df),
-                    'journal_lines': len(df),
-                    'posted': False
-                }
-                
-                total_advertising += settlement_advertising
-            else:
-                results[settlement_id] = {
-                    'local_advertising': 0,
-                    'line_count': 0,
-                    'journal_lines': len(df),
-                    'posted': False
-                }
-        except Exception as e:
-            print(f"  Error reading {settlement_id}: {e}")
-            results[settlement_id] = {
-                'local_advertising': 0,
-                'line_count': 0,
-                'journal_lines': 0,
-                'posted': False,
-                'error': str(e)
+            for line in line_items:
+                account_name = line.get('account_name', '')
+                if 'Advertising' in account_name or account_name == ADVERTISING_ACCOUNT:
+                    # Advertising expenses are credits
+                    credit = float(line.get('credit', 0))
+                    advertising_total += credit
+                    advertising_lines.append(line)
+            
+            return {
+                'journal_id': journal_id,
+                'zoho_advertising': advertising_total,
+                'advertising_line_count': len(advertising_lines),
+                'total_line_count': len(line_items),
+                'posted': True
             }
-    
-    return results, total_advertising
+        return {
+            'journal_id': journal_id,
+            'zoho_advertising': 0,
+            'posted': True,
+            'error': 'Could not retrieve journal details'
+        }
+    except Exception as e:
+        print(f"  Error checking {settlement_id}: {e}")
+        return {
+            'journal_id': None,
+            'zoho_advertising': 0,
+            'posted': False,
+            'error': str(e)
+        }
 
 
-def check_zoho_journals(zoho: ZohoBooks, settlements: list) -> Dict:
-    """Check what's actually posted in Zoho Books."""
-    zoho_results = {}
+def check_zoho_journals(zoho: ZohoBooks, settlements: list, max_workers: int = 8) -> Dict:
+    """
+    Check what's actually posted in Zoho Books.
     
+    The journal list is paged through once for all settlements, then the
+    posted journals' details are fetched on up to max_workers threads.
+    ZohoBooks rate-limits every request across those threads, which keeps
+    the request rate within Zoho's API limits.
+    """
     print("\nChecking Zoho Books for posted journals...")
     
-    for settlement_id in settlements:
+    journal_ids = zoho.find_existing_journals(settlements)
+    zoho_results = {
+        settlement_id: {
+            'journal_id': None,
+            'zoho_advertising': 0,
+            'posted': False
+        }
+        for settlement_id in settlements
+    }
+    
+    posted = [sid for sid in settlements if sid in journal_ids]
+    if posted:
         try:
-            journal_id = zoho.check_existing_journal(settlement_id)
-            if journal_id:
-                # Get journal details
-                result = zoho._api_request('GET', f'journals/{journal_id}')
-                if result.get('code') == 0:
-                    journal = result.get('journal', {})
-                    line_items = journal.get('line_items', [])
-                    
-                    # Find advertising expense lines
-                    advertising_total = 0
-                    advertising_lines = []
-                    
-                    for line in line_items:
-                        account_name = line.get('account_name', '')
-                        if 'Advertising' in account_name or account_name == 'Amazon Advertising Expense':
-                            # Advertising expenses are credits
-                            credit = float(line.get('credit', 0))
-                            advertising_total += credit
-                            advertising_lines.append(line)
-                    
-                    zoho_results[settlement_id] = {
-                        'journal_id': journal_id,
-                        'zoho_advertising': advertising_total,
-                        'advertising_line_count': len(advertising_lines),
-                        'total_line_count': len(line_items),
-                        'posted': True
-                    }
-                else:
-                    zoho_results[settlement_id] = {
-                        'journal_id': journal_id,
-                        'zoho_advertising': 0,
-                        'posted': True,
-                        'error': 'Could not retrieve journal details'
-                    }
-            else:
+            zoho._get_headers()  # refresh the token once, not in every worker
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                details = executor.map(
+                    lambda sid: _zoho_journal_advertising(zoho, sid, journal_ids[sid]), posted
+                )
+                for settlement_id, data in zip(posted, details):
+                    zoho_results[settlement_id] = data
+        except Exception as e:
+            print(f"  Error checking Zoho journals: {e}")
+            for settlement_id in posted:
                 zoho_results[settlement_id] = {
-                    'journal_id': None,
+                    'journal_id': journal_ids[settlement_id],
                     'zoho_advertising': 0,
-                    'posted': False
+                    'posted': False,
+                    'error': str(e)
                 }
-        except Exception as e:
-            print(f"  Error checking {settlement_id}: {e}")
-            zoho_results[settlement_id] = {
-                'journal_id': None,
-                'zoho_advertising': 0,
-                'posted': False,
-                'error': str(e)
-            }
     
     return zoho_results
 
@@ -141,7 +220,7 @@ def check_settlement_history() -> pd.DataFrame:
     if not history_file.exists():
         return pd.DataFrame()
     
-    df = pd.read_csv(history_file)
+    df = read_csv_columns(history_file, ['settlement_id', 'zoho_synced', 'gl_Amazon_Advertising_Expense'])
     df['gl_Amazon_Advertising_Expense'] = pd.to_numeric(
         df['gl_Amazon_Advertising_Expense'], 
         errors='coerce'
@@ -184,9 +263,10 @@ def main():
             print(f"  Posted Settlements: {len(posted)}/{len(latest)}")
             
             print("\n  Per Settlement (History):")
-            for sid in sorted(latest.index):
-                adv = latest.loc[sid, 'gl_Amazon_Advertising_Expense']
-                synced = latest.loc[sid, 'zoho_synced']
+            # groupby already sorts by settlement; read the two columns as arrays once
+            for sid, adv, synced in zip(latest.index,
+                                        latest['gl_Amazon_Advertising_Expense'].to_numpy(),
+                                        latest['zoho_synced'].to_numpy()):
                 if adv != 0:
                     status = "POSTED" if synced else "NOT POSTED"
                     print(f"    {sid}: ${adv:,.2f} ({status})")
@@ -195,7 +275,9 @@ def main():
     print("\n[3] Checking Zoho Books...")
     zoho = ZohoBooks()
     settlements = list(local_results.keys())
+    ZohoBooks.load_journal_cache(JOURNAL_CACHE_FILE)
     zoho_results = check_zoho_journals(zoho, settlements)
+    ZohoBooks.save_journal_cache(JOURNAL_CACHE_FILE)
     
     zoho_total = sum(r.get('zoho_advertising', 0) for r in zoho_results.values())
     print(f"  Total Advertising Expense (Zoho): ${zoho_total:,.2f}")
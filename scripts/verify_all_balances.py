@@ -12,37 +12,56 @@ Usage:
     python scripts/verify_all_balances.py
 """
 
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import time
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from zoho_sync import ZohoBooks
 from paths import get_zoho_tracking_path
+from validate_settlement import read_csv_columns, read_csv_header
+
+# Settlements checked against Zoho at once; ZohoBooks rate-limits every request,
+# which keeps the total under Zoho's 100 requests/minute
+ZOHO_MAX_WORKERS = 8
+
+# Settlements whose local CSVs are parsed at once (pandas/pyarrow release the GIL while parsing)
+LOCAL_MAX_WORKERS = 8
+
 
 def find_all_settlements():
     """Find all settlement IDs from output directories"""
     output_dir = Path("outputs")
-    settlements = []
     
     if not output_dir.exists():
-        return settlements
-    
-    for item in output_dir.iterdir():
-        if item.is_dir() and item.name.isdigit():
-            settlements.append(item.name)
+        return []
     
-    return sorted(settlements)
+    # scandir reports the entry type from the directory listing (no stat per entry)
+    with os.scandir(output_dir) as entries:
+        return sorted(e.name for e in entries if e.name.isdigit() and e.is_dir())
 
 
-def check_journal_balance(settlement_id: str) -> dict:
-    """Check journal balance for a settlement"""
+def _file_exists(path: Path, files: set = None) -> bool:
+    """Whether path exists, looked up in its folder listing when one is given"""
+    return path.name in files if files is not None else path.exists()
+
+
+def check_journal_balance(settlement_id: str, files: set = None) -> dict:
+    """
+    Check journal balance for a settlement
+    
+    Args:
+        settlement_id: Settlement ID
+        files: File names in the settlement's output folder (checked on disk when not given)
+    """
     journal_file = Path("outputs") / settlement_id / f"Journal_{settlement_id}.csv"
     
-    if not journal_file.exists():
+    if not _file_exists(journal_file, files):
         return {
             'settlement_id': settlement_id,
             'has_journal': False,
@@ -54,9 +73,10 @@ def check_journal_balance(settlement_id: str) -> dict:
         }
     
     try:
-        df = pd.read_csv(journal_file)
-        debits = pd.to_numeric(df.get('Debit', 0), errors='coerce').fillna(0).sum()
-        credits = pd.to_numeric(df.get('Credit', 0), errors='coerce').fillna(0).sum()
+        # Only the amount columns, parsed as float64 (non-numbers become NaN, skipped by sum)
+        df = read_csv_columns(journal_file, ['Debit', 'Credit'], numeric=['Debit', 'Credit'])
+        debits = df['Debit'].sum()
+        credits = df['Credit'].sum()
         difference = round(float(debits - credits), 2)
         
         return {
@@ -80,8 +100,14 @@ def check_journal_balance(settlement_id: str) -> dict:
         }
 
 
-def check_invoice_payment_balance(settlement_id: str) -> dict:
-    """Check invoice and payment totals for a settlement"""
+def check_invoice_payment_balance(settlement_id: str, files: set = None) -> dict:
+    """
+    Check invoice and payment totals for a settlement
+    
+    Args:
+        settlement_id: Settlement ID
+        files: File names in the settlement's output folder (checked on disk when not given)
+    """
     invoice_file = Path("outputs") / settlement_id / f"Invoice_{settlement_id}.csv"
     payment_file = Path("outputs") / settlement_id / f"Payment_{settlement_id}.csv"
     
@@ -99,40 +125,44 @@ def check_invoice_payment_balance(settlement_id: str) -> dict:
     }
     
     # Check invoices
-    if invoice_file.exists():
+    if _file_exists(invoice_file, files):
         try:
-            df_inv = pd.read_csv(invoice_file)
-            result['has_invoices'] = True
-            result['invoice_count'] = len(df_inv['Invoice Number'].unique()) if 'Invoice Number' in df_inv.columns else 0
-            
-            # Try to find amount column
+            # Try to find amount column (from the header, so only the needed columns are parsed)
+            header = read_csv_header(invoice_file)
             amount_col = None
             for col in ['Invoice Line Amount', 'amount', 'rate', 'line_amount', 'total']:
-                if col in df_inv.columns:
+                if col in header:
                     amount_col = col
                     break
             
+            amount_cols = [amount_col] if amount_col else []
+            df_inv = read_csv_columns(invoice_file, ['Invoice Number'] + amount_cols, numeric=amount_cols)
+            result['has_invoices'] = True
+            result['invoice_count'] = df_inv['Invoice Number'].nunique(dropna=False) if 'Invoice Number' in df_inv.columns else 0
+            
             if amount_col:
-                result['invoice_total'] = round(float(pd.to_numeric(df_inv[amount_col], errors='coerce').fillna(0).sum()), 2)
+                result['invoice_total'] = round(float(df_inv[amount_col].sum()), 2)
         except Exception as e:
             result['error'] = f"Invoice error: {str(e)}"
     
     # Check payments
-    if payment_file.exists():
+    if _file_exists(payment_file, files):
         try:
-            df_pay = pd.read_csv(payment_file)
-            result['has_payments'] = True
-            result['payment_count'] = len(df_pay)
-            
             # Try to find amount column
+            header = read_csv_header(payment_file)
             amount_col = None
             for col in ['Payment Amount', 'amount', 'payment_amount', 'total']:
-                if col in df_pay.columns:
+                if col in header:
                     amount_col = col
                     break
             
+            amount_cols = [amount_col] if amount_col else []
+            df_pay = read_csv_columns(payment_file, amount_cols or None, numeric=amount_cols)
+            result['has_payments'] = True
+            result['payment_count'] = len(df_pay)
+            
             if amount_col:
-                result['payment_total'] = round(float(pd.to_numeric(df_pay[amount_col], errors='coerce').fillna(0).sum()), 2)
+                result['payment_total'] = round(float(df_pay[amount_col].sum()), 2)
         except Exception as e:
             if result['error']:
                 result['error'] += f"; Payment error: {str(e)}"
@@ -165,18 +195,16 @@ def check_zoho_reconciliation(settlement_id: str, zoho: ZohoBooks) -> dict:
         if inv_result.get('code') == 0:
             invoices = inv_result.get('invoices', [])
             result['zoho_invoice_count'] = len(invoices)
-            result['zoho_invoice_total'] = round(sum(float(inv.get('total', 0) or 0) for inv in invoices), 2)
-        
-        time.sleep(2)  # Rate limit delay
+            totals = np.fromiter((float(inv.get('total', 0) or 0) for inv in invoices), np.float64, len(invoices))
+            result['zoho_invoice_total'] = round(float(totals.sum()), 2)
         
         # Check payments
         pay_result = zoho._api_request('GET', f'customerpayments?reference_number={settlement_id}&per_page=200')
         if pay_result.get('code') == 0:
             payments = pay_result.get('customerpayments', [])
             result['zoho_payment_count'] = len(payments)
-            result['zoho_payment_total'] = round(sum(float(p.get('amount', 0) or 0) for p in payments), 2)
-        
-        time.sleep(2)  # Rate limit delay
+            amounts = np.fromiter((float(p.get('amount', 0) or 0) for p in payments), np.float64, len(payments))
+            result['zoho_payment_total'] = round(float(amounts.sum()), 2)
         
         # Check journal
         journal_result = zoho._api_request('GET', f'journals?reference_number={settlement_id}&per_page=200')
@@ -190,9 +218,52 @@ def check_zoho_reconciliation(settlement_id: str, zoho: ZohoBooks) -> dict:
     return result
 
 
-def get_tracking_summary(settlement_id: str) -> dict:
-    """Get tracking summary for a settlement"""
+TRACKED_RECORD_TYPES = ['INVOICE', 'PAYMENT', 'JOURNAL']
+
+
+def load_tracking_counts() -> dict:
+    """
+    Tracked and posted record counts for every settlement, from a single
+    read of the tracking file.
+    
+    Returns:
+        Dict of settlement ID -> {'tracked_invoices': n, 'posted_invoices': n, ...}
+    """
     tracking_file = get_zoho_tracking_path()
+    counts = {}
+    
+    if not tracking_file.exists():
+        return counts
+    
+    try:
+        df = pd.read_csv(tracking_file, usecols=['settlement_id', 'record_type', 'status'],
+                         dtype={'settlement_id': str})
+        df = df[df['record_type'].isin(TRACKED_RECORD_TYPES)]
+        
+        # Count by settlement and record type in one grouping
+        grouped = (df['status'] == 'POSTED').groupby([df['settlement_id'], df['record_type']]).agg(['size', 'sum'])
+        for (settlement_id, record_type), tracked, posted in zip(grouped.index, grouped['size'], grouped['sum']):
+            summary = counts.setdefault(settlement_id, {})
+            summary[f'tracked_{record_type.lower()}s'] = int(tracked)
+            summary[f'posted_{record_type.lower()}s'] = int(posted)
+    
+    except Exception as e:
+        pass
+    
+    return counts
+
+
+def get_tracking_summary(settlement_id: str, tracking_counts: dict = None) -> dict:
+    """
+    Get tracking summary for a settlement
+    
+    Args:
+        settlement_id: Settlement ID
+        tracking_counts: Result of load_tracking_counts(), shared across
+            settlements (read here when not given)
+    """
+    if tracking_counts is None:
+        tracking_counts = load_tracking_counts()
     
     result = {
         'settlement_id': settlement_id,
@@ -203,30 +274,22 @@ def get_tracking_summary(settlement_id: str) -> dict:
         'posted_payments': 0,
         'posted_journals': 0
     }
-    
-    if not tracking_file.exists():
-        return result
-    
-    try:
-        df = pd.read_csv(tracking_file)
-        df['settlement_id'] = df['settlement_id'].astype(str)
-        settlement_track = df[df['settlement_id'] == str(settlement_id)]
-        
-        # Count by record type
-        for record_type in ['INVOICE', 'PAYMENT', 'JOURNAL']:
-            records = settlement_track[settlement_track['record_type'] == record_type]
-            count_key = f'tracked_{record_type.lower()}s'
-            posted_key = f'posted_{record_type.lower()}s'
-            
-            result[count_key] = len(records)
-            result[posted_key] = len(records[records['status'] == 'POSTED'])
-    
-    except Exception as e:
-        pass
+    result.update(tracking_counts.get(str(settlement_id), {}))
     
     return result
 
 
+def check_local_files(settlement_id: str, tracking_counts: dict = None) -> tuple:
+    """Journal, invoice/payment and tracking checks for a settlement (no Zoho calls)"""
+    # One directory listing answers every file-exists check for the settlement
+    files = set(os.listdir(Path("outputs") / settlement_id))
+    return (
+        check_journal_balance(settlement_id, files),
+        check_invoice_payment_balance(settlement_id, files),
+        get_tracking_summary(settlement_id, tracking_counts)
+    )
+
+
 def main():
     print("="*80)
     print("COMPREHENSIVE BALANCE VERIFICATION")
@@ -242,64 +305,77 @@ def main():
     print(f"Found {len(settlements)} settlement(s) to verify")
     print()
     
+    # Tracking file read once for every settlement
+    tracking_counts = load_tracking_counts()
+    
     zoho = ZohoBooks()
+    try:
+        zoho._get_headers()  # refresh the token once, not in every worker
+    except Exception as e:
+        # Each Zoho check reports its own failure; the local checks still run
+        print(f"⚠️  Could not refresh Zoho access token: {e}")
+        print()
     
     all_results = []
     
-    for i, settlement_id in enumerate(settlements, 1):
-        print(f"[{i}/{len(settlements)}] Verifying settlement {settlement_id}...")
-        
-        # Check journal balance
-        journal_check = check_journal_balance(settlement_id)
-        
-        # Check invoice/payment balance
-        inv_pay_check = check_invoice_payment_balance(settlement_id)
-        
-        # Check Zoho reconciliation (with delays for rate limits)
-        if i > 1:  # Skip delay for first one
-            print(f"  Waiting 5s for rate limits...")
-            time.sleep(5)
-        zoho_check = check_zoho_reconciliation(settlement_id, zoho)
-        
-        # Get tracking summary
-        tracking_summary = get_tracking_summary(settlement_id)
-        
-        # Combine results
-        result = {
-            'settlement_id': settlement_id,
-            **journal_check,
-            **inv_pay_check,
-            **zoho_check,
-            **tracking_summary,
-            'all_checks_passed': (
-                journal_check.get('balanced', False) and
-                inv_pay_check.get('balanced', False) and
-                zoho_check.get('zoho_journal_exists', False) and
-                zoho_check.get('zoho_invoice_count', 0) > 0
-            )
+    # Zoho checks are network-bound: run them for all settlements in the
+    # background (rate-limited). The local file checks run on their own pool;
+    # results are still reported in settlement order
+    with ThreadPoolExecutor(max_workers=ZOHO_MAX_WORKERS) as executor, \
+            ThreadPoolExecutor(max_workers=LOCAL_MAX_WORKERS) as local_executor:
+        zoho_futures = {
+            settlement_id: executor.submit(check_zoho_reconciliation, settlement_id, zoho)
+            for settlement_id in settlements
         }
+        local_checks = local_executor.map(
+            lambda settlement_id: check_local_files(settlement_id, tracking_counts), settlements
+        )
         
-        all_results.append(result)
-        
-        # Print summary
-        journal_status = "OK" if journal_check['balanced'] else "OUT OF BALANCE"
-        print(f"  Journal: {journal_status} "
-              f"Debits=${journal_check['debits']:,.2f} Credits=${journal_check['credits']:,.2f} "
-              f"Diff=${journal_check['difference']:,.2f}")
-        
-        if inv_pay_check['has_invoices'] and inv_pay_check['has_payments']:
-            inv_pay_status = "OK" if inv_pay_check['balanced'] else "MISMATCH"
-            print(f"  Invoice/Payment: {inv_pay_status} "
-                  f"Invoices=${inv_pay_check['invoice_total']:,.2f} "
-                  f"Payments=${inv_pay_check['payment_total']:,.2f} "
-                  f"Diff=${inv_pay_check['difference']:,.2f}")
+        for i, (settlement_id, local_check) in enumerate(zip(settlements, local_checks), 1):
+            print(f"[{i}/{len(settlements)}] Verifying settlement {settlement_id}...")
+            
+            # Journal balance, invoice/payment balance and tracking summary
+            journal_check, inv_pay_check, tracking_summary = local_check
+            
+            # Check Zoho reconciliation
+            zoho_check = zoho_futures[settlement_id].result()
+            
+            # Combine results
+            result = {
+                'settlement_id': settlement_id,
+                **journal_check,
+                **inv_pay_check,
+                **zoho_check,
+                **tracking_summary,
+                'all_checks_passed': (
+                    journal_check.get('balanced', False) and
+                    inv_pay_check.get('balanced', False) and
+                    zoho_check.get('zoho_journal_exists', False) and
+                    zoho_check.get('zoho_invoice_count', 0) > 0
+                )
+            }
+            
+            all_results.append(result)
+            
+            # Print summary
+            journal_status = "OK" if journal_check['balanced'] else "OUT OF BALANCE"
+            print(f"  Journal: {journal_status} "
+                  f"Debits=${journal_check['debits']:,.2f} Credits=${journal_check['credits']:,.2f} "
+                  f"Diff=${journal_check['difference']:,.2f}")
+            
+            if inv_pay_check['has_invoices'] and inv_pay_check['has_payments']:
+                inv_pay_status = "OK" if inv_pay_check['balanced'] else "MISMATCH"
+                print(f"  Invoice/Payment: {inv_pay_status} "
+                      f"Invoices=${inv_pay_check['invoice_total']:,.2f} "
+                      f"Payments=${inv_pay_check['payment_total']:,.2f} "
+                      f"Diff=${inv_pay_check['difference']:,.2f}")
+            
+            if zoho_check.get('zoho_invoice_count', 0) > 0:
+                journal_status = "EXISTS" if zoho_check['zoho_journal_exists'] else "MISSING"
+                print(f"  Zoho: {zoho_check['zoho_invoice_count']} invoices, "
+                      f"{zoho_check['zoho_payment_count']} payments, "
+                      f"journal {journal_status}")
         
-        if zoho_check.get('zoho_invoice_count', 0) > 0:
-            journal_status = "EXISTS" if zoho_check['zoho_journal_exists'] else "MISSING"
-            print(f"  Zoho: {zoho_check['zoho_invoice_count']} invoices, "
-                  f"{zoho_check['zoho_payment_count']} payments, "
-                  f"journal {journal_status}")
-    
     # Create summary DataFrame
     df = pd.DataFrame(all_results)
     
@@ -316,13 +392,11 @@ def main():
     balanced_inv_pay = df[df['balanced'] == True].shape[0]  # Re-check for invoice/payment balance
     has_both = df[(df['has_invoices'] == True) & (df['has_payments'] == True)].shape[0]
     
-    # Recalculate invoice/payment balanced count
-    inv_pay_balanced = 0
-    for _, row in df.iterrows():
-        if row['has_invoices'] and row['has_payments']:
-            diff = abs(row.get('invoice_total', 0) - row.get('payment_total', 0))
-            if diff < 0.01:
-                inv_pay_balanced += 1
+    # Recalculate invoice/payment balanced count (totals are floats from the checks)
+    inv_pay_balanced = (
+        df['has_invoices'] & df['has_payments'] &
+        ((df['invoice_total'] - df['payment_total']).abs() < 0.01)
+    ).sum()
     
     print(f"\nJournal Balances:")
     print(f"  Balanced: {balanced_journals}/{total_journals} settlements")
@@ -16,22 +16,68 @@ from post_all_settlements import find_local_settlements
 from paths import get_zoho_tracking_path
 
 
-def verify_and_fix_invoice_ids(zoho: ZohoBooks, settlement_id: str) -> dict:
-    """Verify invoice IDs in tracking file and fix if needed."""
-    tracking_file = get_zoho_tracking_path()
+def _tracked_id(value) -> str:
+    """Tracked Zoho ID as a string (None for NaN, no '.0' for IDs read as floats)."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, float):
+        return f"{value:.0f}"
+    return str(value).strip()
+
+
+class TrackingTable:
+    """
+    zoho_tracking.csv loaded once for all settlements.
+    
+    Re-read only when the file changed since it was loaded or saved here
+    (post_settlement_complete writes it when posting).
+    """
+    
+    def __init__(self, tracking_file: Path):
+        self.tracking_file = tracking_file
+        self.df = None
+        self.invoice_rows = {}  # settlement_id -> row labels of its INVOICE records
+        self._mtime = None
+    
+    def load(self) -> pd.DataFrame:
+        """Tracking frame with settlement IDs as text (cached while the file is unchanged)"""
+        mtime = self.tracking_file.stat().st_mtime_ns
+        if self.df is None or mtime != self._mtime:
+            df = pd.read_csv(self.tracking_file)
+            df['settlement_id'] = df['settlement_id'].astype(str)
+            is_invoice = df['record_type'] == 'INVOICE'
+            self.invoice_rows = df.index[is_invoice].groupby(df['settlement_id'][is_invoice])
+            self.df = df
+            self._mtime = mtime
+        return self.df
+    
+    def save(self):
+        """Write the frame back to the tracking file"""
+        self.df.to_csv(self.tracking_file, index=False)
+        self._mtime = self.tracking_file.stat().st_mtime_ns
+
+
+def verify_and_fix_invoice_ids(zoho: ZohoBooks, settlement_id: str, tracking: TrackingTable = None) -> dict:
+    """
+    Verify invoice IDs in tracking file and fix if needed.
+    
+    Args:
+        zoho: Zoho Books client
+        settlement_id: Settlement ID
+        tracking: Tracking table shared across settlements (loaded here when not given)
+    """
+    if tracking is None:
+        tracking = TrackingTable(get_zoho_tracking_path())
     
-    if not tracking_file.exists():
+    if not tracking.tracking_file.exists():
         print(f"  [ERROR] Tracking file not found")
         return {}
     
-    df = pd.read_csv(tracking_file)
-    df['settlement_id'] = df['settlement_id'].astype(str)
+    df = tracking.load()
     
     # Get invoices for this settlement
-    settlement_invoices = df[
-        (df['settlement_id'] == str(settlement_id)) &
-        (df['record_type'] == 'INVOICE')
-    ].copy()
+    rows = tracking.invoice_rows.get(str(settlement_id))
+    settlement_invoices = df.loc[rows] if rows is not None else df.iloc[:0]
     
     if len(settlement_invoices) == 0:
         print(f"  [WARN] No invoices in tracking file for settlement {settlement_id}")
@@ -40,7 +86,8 @@ def verify_and_fix_invoice_ids(zoho: ZohoBooks, settlement_id: str) -> dict:
     print(f"  Found {len(settlement_invoices)} invoice(s) in tracking file")
     
     invoice_map = {}
-    updated_count = 0
+    fixed_rows = []  # tracking file rows to update
+    fixed_ids = []
     
     # Query Zoho for all invoices with this reference_number
     print(f"  Querying Zoho for invoices (reference_number={settlement_id})...")
@@ -56,47 +103,41 @@ def verify_and_fix_invoice_ids(zoho: ZohoBooks, settlement_id: str) -> dict:
         zoho_invoices = api_result.get('invoices', [])
         print(f"  Found {len(zoho_invoices)} invoice(s) in Zoho")
         
-        # Build map: invoice_number -> invoice_id from Zoho
-        zoho_map = {}
-        for zoho_inv in zoho_invoices:
-            inv_num = str(zoho_inv.get('invoice_number', '')).strip()
-            inv_id = str(zoho_inv.get('invoice_id', '')).strip()
-            if inv_num and inv_id:
-                zoho_map[inv_num] = inv_id
+        # Build map: invoice_number -> invoice_id from Zoho (the API returns both as strings)
+        zoho_map = {
+            zoho_inv['invoice_number']: zoho_inv['invoice_id']
+            for zoho_inv in zoho_invoices
+            if zoho_inv.get('invoice_number') and zoho_inv.get('invoice_id')
+        }
+        
+        # Look up every local invoice number in Zoho at once
+        local_inv_nums = settlement_invoices['local_identifier'].astype(str).str.strip()
+        correct_inv_ids = local_inv_nums.map(zoho_map)
+        tracked_inv_ids = [_tracked_id(value) for value in settlement_invoices['zoho_id']]
         
         # Now check each local invoice
-        for idx, row in settlement_invoices.iterrows():
-            local_inv_num = str(row['local_identifier']).strip()
-            tracked_inv_id = row['zoho_id']
-            
-            # Convert tracked ID to string (handle NaN, float, etc.)
-            if pd.isna(tracked_inv_id):
-                tracked_inv_id = None
-            elif isinstance(tracked_inv_id, float):
-                tracked_inv_id = f"{tracked_inv_id:.0f}"
-            else:
-                tracked_inv_id = str(tracked_inv_id).strip()
-            
+        for idx, local_inv_num, tracked_inv_id, correct_inv_id in zip(
+                settlement_invoices.index, local_inv_nums, tracked_inv_ids, correct_inv_ids):
             # Check if Zoho has this invoice_number
-            if local_inv_num in zoho_map:
-                correct_inv_id = zoho_map[local_inv_num]
+            if pd.notna(correct_inv_id):
                 invoice_map[local_inv_num] = correct_inv_id
                 
                 # Update tracking file if ID is different
                 if tracked_inv_id != correct_inv_id:
-                    df.loc[idx, 'zoho_id'] = correct_inv_id
-                    df.loc[idx, 'status'] = 'POSTED'
-                    updated_count += 1
+                    fixed_rows.append(idx)
+                    fixed_ids.append(correct_inv_id)
                     print(f"    Fixed {local_inv_num}: {tracked_inv_id} -> {correct_inv_id}")
                 else:
                     print(f"    OK {local_inv_num}: {correct_inv_id}")
             else:
                 print(f"    [WARN] Invoice {local_inv_num} not found in Zoho")
         
-        # Save updated tracking file
-        if updated_count > 0:
-            df.to_csv(tracking_file, index=False)
-            print(f"  Updated {updated_count} invoice ID(s) in tracking file")
+        # Apply all fixes in one assignment and save updated tracking file
+        if fixed_rows:
+            df.loc[fixed_rows, 'zoho_id'] = fixed_ids
+            df.loc[fixed_rows, 'status'] = 'POSTED'
+            tracking.save()
+            print(f"  Updated {len(fixed_rows)} invoice ID(s) in tracking file")
         
         return invoice_map
         
@@ -134,6 +175,9 @@ def main():
     
     zoho = ZohoBooks()
     
+    # Tracking file read once, not once per settlement (re-read after postings change it)
+    tracking = TrackingTable(get_zoho_tracking_path())
+    
     # Process each settlement
     for i, settlement_id in enumerate(settlements_needing_payments, 1):
         print(f"\n{'='*80}")
@@ -141,7 +185,7 @@ def main():
         print(f"{'='*80}")
         
         # Step 1: Verify and fix invoice IDs
-        invoice_map = verify_and_fix_invoice_ids(zoho, settlement_id)
+        invoice_map = verify_and_fix_invoice_ids(zoho, settlement_id, tracking)
         
         # Check if we need to post invoices first
         invoice_file = Path("outputs") / settlement_id / f"Invoice_{settlement_id}.csv"
@@ -184,7 +228,7 @@ def main():
                     # Re-verify invoice IDs after posting
                     print(f"  Re-verifying invoice IDs...")
                     time.sleep(10)
-                    invoice_map = verify_and_fix_invoice_ids(zoho, settlement_id)
+                    invoice_map = verify_and_fix_invoice_ids(zoho, settlement_id, tracking)
                 else:
                     error = inv_results['invoices'].get('error', 'Unknown error')
                     print(f"  [FAILED] {error}")
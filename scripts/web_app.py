@@ -354,6 +354,9 @@ def process_files():
             payments_data
         )
         
+        # Invoices and payments are only needed for the merge; free them for the exports
+        del invoices_data, payments_data
+        
         # Initialize exporter
         exporter = DataExporter(config)
         if hasattr(transformer, 'price_lookup_data'):
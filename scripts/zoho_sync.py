@@ -7,6 +7,9 @@ import yaml
 import requests
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
@@ -14,9 +17,46 @@ from typing import Dict, List, Optional, Tuple
 logger = logging.getLogger(__name__)
 
 
+class RateLimiter:
+    """Space calls at least `interval` seconds apart across all threads"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+    
+    def wait(self):
+        """Block until this caller's slot comes up"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class ZohoBooks:
     """Interface for Zoho Books API with Canada data center support"""
     
+    # Zoho allows about 100 API requests per minute. Every request from every
+    # client and thread in the process waits its turn on this limiter.
+    MIN_REQUEST_INTERVAL_SECONDS = 0.7
+    _rate_limiter = RateLimiter(MIN_REQUEST_INTERVAL_SECONDS)
+    
+    # Guards the class-level ID caches below, which worker threads update
+    _cache_lock = threading.Lock()
+    
+    # SKU -> (item_id, cached_at) lookups shared by every client in the process
+    # (oldest dropped past the cap, entries expire after the TTL)
+    ITEM_CACHE_SIZE = 5000
+    ITEM_CACHE_TTL_SECONDS = 24 * 3600
+    _item_id_cache: Dict[str, Tuple[str, float]] = {}
+    
+    # Journal reference number -> (journal_id, cached_at) for posted journals.
+    # Cleared on delete_journal; the TTL covers journals deleted outside this client.
+    JOURNAL_CACHE_TTL_SECONDS = 24 * 3600
+    _journal_id_cache: Dict[str, Tuple[str, float]] = {}
+    
     def __init__(self, config_file: str = None):
         """Initialize Zoho Books API client"""
         if config_file is None:
@@ -102,6 +142,7 @@ class ZohoBooks:
         # Log transaction details to dedicated file
         self._log_transaction(method, endpoint, data)
         
+        self._rate_limiter.wait()
         if method == 'GET':
             response = requests.get(url, headers=headers, params=params)
         elif method == 'POST':
@@ -303,6 +344,7 @@ class ZohoBooks:
                     for journal in journals:
                         if journal.get('reference_number') == settlement_id:
                             journal_id = journal['journal_id']
+                            self._cache_journal_id(settlement_id, journal_id)
                             logger.warning(f"Settlement {settlement_id} already exists in Zoho (ID: {journal_id})")
                             return journal_id
                     
@@ -323,6 +365,48 @@ class ZohoBooks:
             # Don't fail - just continue (better to try posting and catch duplicate error)
             return None
     
+    def find_existing_journals(self, settlement_ids: List[str]) -> Dict[str, str]:
+        """
+        Find existing journal entries for many settlements at once.
+        
+        Settlements found in the journal ID cache (see load_journal_cache)
+        need no request; for the rest the journal list is paged through a
+        single time (check_existing_journal pages through it once per
+        settlement), stopping as soon as every settlement has been found.
+        
+        Returns:
+            Dict of settlement ID -> journal ID for settlements already in Zoho
+        """
+        wanted = {str(sid) for sid in settlement_ids}
+        found = {}
+        for sid in wanted:
+            cached = self._cached_journal_id(sid)
+            if cached:
+                found[sid] = cached
+        
+        page = 1
+        while wanted - found.keys():
+            try:
+                result = self._api_request('GET', f'journals?page={page}&per_page=200')
+            except Exception as e:
+                logger.error(f"Error checking existing journals: {e}")
+                break
+            if result.get('code') != 0:
+                logger.error(f"Failed to check journals: {result}")
+                break
+            
+            for journal in result.get('journals', []):
+                reference = journal.get('reference_number')
+                if reference in wanted and reference not in found:
+                    found[reference] = journal['journal_id']
+                    self._cache_journal_id(reference, journal['journal_id'])
+            
+            if not result.get('page_context', {}).get('has_more_page', False):
+                break
+            page += 1
+        
+        return found
+    
     def create_journal_entry(self, settlement_id: str, journal_data, 
                            dry_run: bool = True, individual_lines: bool = False,
                            reference_number: Optional[str] = None, force: bool = False) -> Optional[str]:
@@ -472,6 +556,7 @@ class ZohoBooks:
             if result.get('code') == 0:
                 journal_id = result['journal']['journal_id']
                 logger.info(f"[OK] Journal entry created: {journal_id}")
+                self._cache_journal_id(payload['reference_number'], journal_id)
                 return journal_id
             else:
                 logger.error(f"Failed to create journal: {result}")
@@ -619,6 +704,7 @@ class ZohoBooks:
             result = self._api_request('DELETE', f'journals/{journal_id}')
             if result.get('code') == 0:
                 logger.info(f"[OK] Journal deleted: {journal_id}")
+                self._forget_journal_id(journal_id)
                 return True
             else:
                 logger.error(f"Failed to delete journal {journal_id}: {result}")
@@ -638,8 +724,173 @@ class ZohoBooks:
             logger.error(f"Error getting customer: {e}")
             return None
     
+    @classmethod
+    def _cache_item_id(cls, sku: str, item_id: str, cached_at: float = None):
+        """Remember a SKU's item ID, dropping the oldest entry past ITEM_CACHE_SIZE"""
+        cache = cls._item_id_cache
+        with cls._cache_lock:
+            cache.pop(sku, None)
+            cache[sku] = (item_id, time.time() if cached_at is None else cached_at)
+            if len(cache) > cls.ITEM_CACHE_SIZE:
+                cache.pop(next(iter(cache)))
+    
+    @classmethod
+    def _cached_item_id(cls, sku: str) -> Optional[str]:
+        """Item ID for a SKU from the cache, or None if unknown or expired"""
+        entry = cls._item_id_cache.get(sku)
+        if entry and time.time() - entry[1] < cls.ITEM_CACHE_TTL_SECONDS:
+            return entry[0]
+        return None
+    
+    @staticmethod
+    def _read_id_cache(cache_file: Path, id_key: str, ttl: float) -> List[Tuple[str, str, float]]:
+        """Unexpired (key, id, cached_at) entries of a JSON ID cache file, oldest first"""
+        cache_file = Path(cache_file)
+        if not cache_file.exists():
+            return []
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ID cache {cache_file}: {e}")
+            return []
+        
+        now = time.time()
+        return [
+            (key, entry[id_key], entry.get('cached_at', 0))
+            for key, entry in sorted(entries.items(), key=lambda kv: kv[1].get('cached_at', 0))
+            if entry.get(id_key) and now - entry.get('cached_at', 0) < ttl
+        ]
+    
+    @staticmethod
+    def _write_id_cache(cache_file: Path, cache: Dict[str, Tuple[str, float]], id_key: str):
+        """Write a key -> (id, cached_at) cache as JSON"""
+        cache_file = Path(cache_file)
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            entries = {key: {id_key: value, 'cached_at': cached_at}
+                       for key, (value, cached_at) in cache.items()}
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+        except OSError as e:
+            logger.warning(f"Could not save ID cache {cache_file}: {e}")
+    
+    @classmethod
+    def load_item_cache(cls, cache_file: Path):
+        """Load unexpired SKU -> item ID entries saved by save_item_cache()"""
+        for sku, item_id, cached_at in cls._read_id_cache(cache_file, 'item_id', cls.ITEM_CACHE_TTL_SECONDS):
+            cls._cache_item_id(sku, item_id, cached_at)
+    
+    @classmethod
+    def save_item_cache(cls, cache_file: Path):
+        """Save the SKU -> item ID cache (with timestamps) for later runs"""
+        with cls._cache_lock:
+            cache = dict(cls._item_id_cache)
+        cls._write_id_cache(cache_file, cache, 'item_id')
+    
+    @classmethod
+    def _cache_journal_id(cls, reference: str, journal_id: str, cached_at: float = None):
+        """Remember the journal posted under a reference number"""
+        with cls._cache_lock:
+            cls._journal_id_cache[str(reference)] = (journal_id, time.time() if cached_at is None else cached_at)
+    
+    @classmethod
+    def _cached_journal_id(cls, reference: str) -> Optional[str]:
+        """Journal ID for a reference number from the cache, or None if unknown or expired"""
+        entry = cls._journal_id_cache.get(str(reference))
+        if entry and time.time() - entry[1] < cls.JOURNAL_CACHE_TTL_SECONDS:
+            return entry[0]
+        return None
+    
+    @classmethod
+    def _forget_journal_id(cls, journal_id: str):
+        """Drop cache entries pointing at a deleted journal"""
+        with cls._cache_lock:
+            for reference, (cached_id, _) in list(cls._journal_id_cache.items()):
+                if cached_id == journal_id:
+                    del cls._journal_id_cache[reference]
+    
+    @classmethod
+    def load_journal_cache(cls, cache_file: Path):
+        """Load unexpired reference -> journal ID entries saved by save_journal_cache()"""
+        for reference, journal_id, cached_at in cls._read_id_cache(
+                cache_file, 'journal_id', cls.JOURNAL_CACHE_TTL_SECONDS):
+            cls._cache_journal_id(reference, journal_id, cached_at)
+    
+    @classmethod
+    def save_journal_cache(cls, cache_file: Path):
+        """Save the reference -> journal ID cache (with timestamps) for later runs"""
+        with cls._cache_lock:
+            cache = dict(cls._journal_id_cache)
+        cls._write_id_cache(cache_file, cache, 'journal_id')
+    
     def get_item_id(self, sku: str) -> Optional[str]:
         """Get item ID by SKU"""
+        cached = self._cached_item_id(sku)
+        if cached:
+            return cached
+        
+        item_id = self._lookup_item_id(sku)
+        if item_id:
+            self._cache_item_id(sku, item_id)
+        return item_id
+    
+    def get_item_ids_bulk(self, skus: List[str], max_workers: int = 8) -> Dict[str, str]:
+        """
+        Get item IDs for many SKUs at once.
+        
+        Pages through the item list (200 per request) until every requested
+        SKU is found, instead of one or two lookups per SKU. SKUs still not
+        found (e.g. only reachable via search) fall back to get_item_id,
+        run concurrently; their requests still share the client rate limit.
+        
+        Returns:
+            Dict of SKU -> item ID for the SKUs that exist in Zoho
+        """
+        wanted = {str(sku) for sku in skus}
+        found = {}
+        for sku in wanted:
+            cached = self._cached_item_id(sku)
+            if cached:
+                found[sku] = cached
+        
+        page = 1
+        while wanted - found.keys():
+            try:
+                result = self._api_request('GET', f'items?per_page=200&page={page}')
+            except Exception as e:
+                logger.warning(f"Item list request failed, falling back to per-SKU lookups: {e}")
+                break
+            if result.get('code') != 0:
+                break
+            
+            for item in result.get('items', []):
+                sku = str(item.get('sku', '')).strip()
+                if sku and item.get('item_id'):
+                    self._cache_item_id(sku, item['item_id'])
+                    if sku in wanted:
+                        found[sku] = item['item_id']
+            
+            if not result.get('page_context', {}).get('has_more_page'):
+                break
+            page += 1
+        
+        remaining = sorted(wanted - found.keys())
+        if remaining:
+            try:
+                self._get_headers()  # refresh the token once, not in every worker
+            except Exception as e:
+                # Each lookup below retries the refresh and returns None on failure
+                logger.warning(f"Could not refresh Zoho access token: {e}")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for sku, item_id in zip(remaining, executor.map(self.get_item_id, remaining)):
+                    if item_id:
+                        found[sku] = item_id
+        
+        return found
+    
+    def _lookup_item_id(self, sku: str) -> Optional[str]:
+        """Look up an item ID by SKU in Zoho (no cache)"""
         try:
             # Try direct SKU lookup first
             result = self._api_request('GET', f'items?sku={sku}')